@@ -0,0 +1,99 @@
+"""Micro-benchmark for block rendering in slack_approval.utils.
+
+Compares the current renderers with the previous implementation, which
+rebuilt every nested dict and label on each call, then the payload size of
+the compact renderer against one section per field.
+
+    python benchmarks/bench_blocks.py --fields 50 --number 2000 --value-length 1000
+"""
+import argparse
+import json
+import timeit
+
+from slack_approval.utils import (
+    get_buttons_blocks,
+    get_compact_inputs_blocks,
+    get_header_block,
+    get_inputs_blocks,
+    get_status_block,
+)
+
+
+def legacy_inputs_blocks(inputs):
+    input_block = [
+        {
+            "type": "section",
+            "text": {
+                "type": "mrkdwn",
+                "text": f"*{' '.join([s.capitalize() for s in key.split('_')])}:* {value}",
+            },
+        }
+        for key, value in inputs.items()
+        if key != "provision_class" and key != "modifiables_fields" and key != "modified" and key != "requester_info"
+    ]
+    input_block.append({"type": "divider"})
+    return input_block
+
+
+def legacy_buttons_blocks(value):
+    confirm = {
+        "title": {"type": "plain_text", "text": "Confirm"},
+        "text": {"type": "mrkdwn", "text": "Are you sure?"},
+        "confirm": {"type": "plain_text", "text": "Do it"},
+        "deny": {"type": "plain_text", "text": "Stop, I've changed my mind!"},
+    }
+    return [{
+        "type": "actions",
+        "elements": [
+            {"type": "button", "text": {"type": "plain_text", "emoji": True, "text": "Approve"},
+             "style": "primary", "action_id": "Approved", "value": value, "confirm": confirm},
+            {"type": "button", "text": {"type": "plain_text", "emoji": True, "text": "Reject"},
+             "value": value, "style": "danger", "action_id": "Rejected"},
+            {"type": "button", "text": {"type": "plain_text", "emoji": True, "text": "Edit"},
+             "value": value, "action_id": "Edit"},
+        ],
+    }]
+
+
+def legacy_render(inputs, value):
+    blocks = [{"type": "header", "text": {"type": "plain_text", "text": "Provision", "emoji": True}},
+              {"type": "divider"}]
+    blocks.extend(legacy_inputs_blocks(inputs))
+    blocks.extend(get_status_block(status="Approved", user="John Doe"))
+    blocks.extend(legacy_buttons_blocks(value))
+    return blocks
+
+
+def render(inputs, value, inputs_blocks=get_inputs_blocks):
+    blocks = []
+    blocks.extend(get_header_block("Provision"))
+    blocks.extend(inputs_blocks(inputs))
+    blocks.extend(get_status_block(status="Approved", user="John Doe"))
+    blocks.extend(get_buttons_blocks(value, edit_button=True))
+    return blocks
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fields", type=int, default=50)
+    parser.add_argument("--number", type=int, default=2000)
+    parser.add_argument("--value-length", type=int, default=0, help="pad values to this many characters")
+    args = parser.parse_args()
+
+    inputs = {"provision_class": "Provision"}
+    inputs.update({f"some_field_name_{i}": f"value {i}".ljust(args.value_length, "x") for i in range(args.fields)})
+    value = json.dumps(inputs)
+    assert json.dumps(render(inputs, value)) == json.dumps(legacy_render(inputs, value))
+
+    for name, function in (("legacy", legacy_render), ("current", render)):
+        seconds = min(timeit.repeat(lambda: function(inputs, value), number=args.number, repeat=5))
+        print(f"{name:>8}: {seconds / args.number * 1e6:8.1f} us per render ({args.fields} fields)")
+
+    # Payload without the button value, which is the same for both
+    for name, inputs_blocks in (("sections", get_inputs_blocks), ("compact", get_compact_inputs_blocks)):
+        blocks = render(inputs, "", inputs_blocks)
+        print(f"{name:>8}: {len(json.dumps(blocks)):8d} bytes, {len(blocks)} blocks")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""End to end benchmark of the approval flows against a local fake Slack API.
+
+Drives SlackRequest and SlackProvision through request -> approve, reject
+and edit -> modified -> approve with signed interaction payloads, and reports
+latency percentiles, Slack calls per flow and throughput per concurrency level.
+
+    python benchmarks/bench_flows.py --latency 0.05 --concurrency 1 4 16
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from slack_approval.clients import SlackClientPool, set_default_pool
+from slack_approval.fake_slack import FakeSlackServer, button_interaction, signed_interaction, view_submission
+from slack_approval.rate_limit import METHOD_LIMITS, SlackScheduler
+from slack_approval.signature import is_signed_request
+from slack_approval.slack_provision import SlackProvision
+from slack_approval.slack_request import AsyncSlackRequest
+
+SIGNING_SECRET = "benchmark-secret"
+APPROVER = {"id": "UAPPROVER", "name": "jane.approver"}
+
+
+class BenchProvision(SlackProvision):
+    def approved(self):
+        pass
+
+    def rejected(self):
+        pass
+
+
+def handle(payload):
+    """Same steps as functions/provision.py"""
+    request = signed_interaction(payload, SIGNING_SECRET)
+    if not is_signed_request(request.headers, request.get_data(), [SIGNING_SECRET]):
+        raise ValueError("invalid signature")
+    slack_provision = SlackProvision(request)
+    slack_provision.__class__ = BenchProvision
+    slack_provision()
+
+
+def submit_request(server, fields):
+    inputs = {
+        "provision_class": "Bench Provision",
+        "requester": "requester@example.com",
+        "prevent_self_approval": True,
+        "modifiables_fields": "field_0;ips",
+        "ips": [f"10.0.0.{i}" for i in range(5)],
+    }
+    inputs.update({f"field_{i}": f"value {i}" for i in range(fields)})
+    slack_request = AsyncSlackRequest(SimpleNamespace(json=inputs))
+    slack_request.send_request_message()
+    channel, ts = slack_request.approvers_channel, slack_request.approvers_ts
+    return channel, ts, server.messages[(channel, ts)]
+
+
+def click(server, channel, ts, action_id):
+    handle(button_interaction(server.messages[(channel, ts)], action_id, APPROVER, channel, ts,
+                              response_url=server.response_url(channel, ts)))
+
+
+def approve_flow(server, fields):
+    channel, ts, _ = submit_request(server, fields)
+    click(server, channel, ts, "Approved")
+
+
+def reject_flow(server, fields):
+    channel, ts, _ = submit_request(server, fields)
+    click(server, channel, ts, "Rejected")
+    view = server.views[f"trigger.{ts}"]
+    handle(view_submission(view, APPROVER, {"reason_block": {"reject_reason_input": {"value": "benchmark"}}}))
+
+
+def edit_flow(server, fields):
+    channel, ts, _ = submit_request(server, fields)
+    click(server, channel, ts, "Edit")
+    view = server.views[f"trigger.{ts}"]
+    values = {}
+    for block in view["blocks"]:
+        if block["type"] != "input":
+            continue
+        element = block["element"]
+        values[block["block_id"]] = {element["action_id"]: {"value": element["initial_value"] + "-edited"}}
+    handle(view_submission(view, APPROVER, values))
+    click(server, channel, ts, "Approved")
+
+
+FLOWS = {"approve": approve_flow, "reject": reject_flow, "edit": edit_flow}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def run(server, flow, iterations, concurrency, fields):
+    def timed(_):
+        start = time.perf_counter()
+        FLOWS[flow](server, fields)
+        return time.perf_counter() - start
+
+    server.reset_calls()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(timed, range(iterations)))
+    elapsed = time.perf_counter() - start
+    calls = server.total_calls() / iterations
+    updates = server.calls.get("chat.update", 0) / iterations
+    print(
+        f"{flow:>8} c={concurrency:<3} "
+        f"p50={percentile(latencies, 50) * 1000:7.1f}ms "
+        f"p90={percentile(latencies, 90) * 1000:7.1f}ms "
+        f"p99={percentile(latencies, 99) * 1000:7.1f}ms "
+        f"calls/flow={calls:5.1f} "
+        f"chat.update/flow={updates:4.1f} "
+        f"throughput={iterations / elapsed:7.1f}/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.02, help="Fake Slack latency per call in seconds")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of calls answered with 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with an error")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--fields", type=int, default=10)
+    parser.add_argument("--flows", nargs="+", default=list(FLOWS), choices=list(FLOWS))
+    parser.add_argument("--paced", action="store_true", help="Keep Slack's rate limits in the scheduler")
+    parser.add_argument("--response-url", action="store_true",
+                        help="Update approvers messages through the response_url, see UPDATE_VIA_RESPONSE_URL")
+    args = parser.parse_args()
+
+    server = FakeSlackServer(latency=args.latency, rate_limit_rate=args.rate_limit_rate,
+                             error_rate=args.error_rate, retry_after=0.1, seed=0).start()
+    scheduler = SlackScheduler()
+    if not args.paced:
+        scheduler = SlackScheduler(method_limits={method: 10 ** 9 for method in METHOD_LIMITS},
+                                   channel_limit=10 ** 9)
+    pool = SlackClientPool(base_url=server.base_url, scheduler=scheduler)
+    set_default_pool(pool)
+    os.environ.update(
+        SLACK_BOT_TOKEN="xoxb-benchmark",
+        APPROVERS_CHANNEL="CAPPROVERS",
+        REQUESTERS_CHANNEL="CREQUESTERS",
+        UPDATE_VIA_RESPONSE_URL="1" if args.response_url else "",
+    )
+    try:
+        for flow in args.flows:
+            for concurrency in args.concurrency:
+                run(server, flow, args.iterations, concurrency, args.fields)
+    finally:
+        pool.close()
+        server.stop()
+    print(f"scheduler: {scheduler.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""Bulk approve/reject of pending requests in one interaction.
+
+A global or message shortcut with callback_id "bulk_review" opens a modal
+listing the requests still pending in the approvers channel. Submitting it
+runs each selected request through its provision class with bounded
+concurrency, then updates all the messages on one loop with a single summary
+reply in each thread.
+"""
+import json
+import logging
+import os
+
+from slack_sdk import errors
+
+from slack_approval.cache import get_default_user_cache
+from slack_approval.clients import get_default_pool
+from slack_approval.deferred import StoredRequest
+from slack_approval.digest import ROW_BLOCK_PREFIX
+from slack_approval.idempotency import get_default_guard
+from slack_approval.metrics import instrumented, timer
+from slack_approval.state import get_default_state_store
+from slack_approval.workspaces import route_payload
+
+logger = logging.getLogger("slack_bulk")
+logger.setLevel(logging.DEBUG)
+
+BULK_SHORTCUT = "bulk_review"
+BULK_MODAL = "bulk_review_modal"
+# multi_static_select option limits
+MAX_OPTIONS = 100
+MAX_OPTION_TEXT = 75
+HISTORY_LIMIT = 200
+DEFAULT_CONCURRENCY = 8
+BULK_ACTIONS = {"Approved": "Approve", "Reject Response": "Reject"}
+PAST_TENSE = {"Approved": "Approved", "Reject Response": "Rejected"}
+
+
+def is_bulk_interaction(payload):
+    if payload.get("type") in ("shortcut", "message_action"):
+        return payload.get("callback_id") == BULK_SHORTCUT
+    return payload.get("type") == "view_submission" and payload.get("view", {}).get("callback_id") == BULK_MODAL
+
+
+async def get_pending_requests(client, channel, limit=HISTORY_LIMIT):
+    """Approvers messages in `channel` that still show the Approve button, newest first"""
+    response = await client.conversations_history(channel=channel, limit=limit)
+    pending = []
+    for message in response["messages"]:
+        actions = [block for block in message.get("blocks", []) if block.get("type") == "actions"]
+        # Digest rows share their message and are reviewed from it
+        if not actions or actions[-1].get("block_id", "").startswith(ROW_BLOCK_PREFIX):
+            continue
+        button = next((e for e in actions[-1].get("elements", []) if e.get("action_id") == "Approved"), None)
+        if button is not None:
+            pending.append({"ts": message["ts"], "value": button["value"], "title": get_title(message)})
+    return pending
+
+
+def get_title(message):
+    """Header and first field of a request message, short enough for an option"""
+    texts = [block["text"]["text"] for block in message.get("blocks", [])
+             if block.get("type") in ("header", "section") and "text" in block][:2]
+    title = " · ".join(texts) or message["ts"]
+    if len(title) > MAX_OPTION_TEXT:
+        title = title[:MAX_OPTION_TEXT - 1] + "…"
+    return title
+
+
+class BulkReview:
+    def __init__(self, request, client_pool=None, user_cache=None, state_store=None, idempotency_guard=None,
+                 resolve=None, concurrency=None):
+        self.data = request.get_data()
+        self.headers = request.headers
+        self.payload = json.loads(request.form["payload"])
+        self.workspace = route_payload(self.payload)
+        if self.workspace is not None:
+            self.client_pool = client_pool or self.workspace.client_pool
+            self.user_cache = user_cache or self.workspace.user_cache
+        else:
+            self.client_pool = client_pool or get_default_pool()
+            self.user_cache = user_cache or get_default_user_cache()
+        self.state_store = state_store or get_default_state_store()
+        self.idempotency_guard = idempotency_guard or get_default_guard()
+        self.resolve = resolve
+        self.concurrency = concurrency or int(os.environ.get("BULK_CONCURRENCY", DEFAULT_CONCURRENCY))
+        self.token = self.workspace.token if self.workspace is not None else os.environ.get("SLACK_BOT_TOKEN")
+        self.results = []
+        if self.payload["type"] == "view_submission":
+            self.channel = json.loads(self.payload["view"]["private_metadata"])["channel"]
+        else:
+            self.channel = self.payload.get("channel", {}).get("id") or (
+                self.workspace.get_channel("APPROVERS_CHANNEL") if self.workspace is not None
+                else os.environ["APPROVERS_CHANNEL"]
+            )
+
+    def __call__(self):
+        if self.payload["type"] == "view_submission":
+            self.review()
+        else:
+            self.open_review_view()
+
+    def is_deferrable(self):
+        return self.payload["type"] == "view_submission"
+
+    def run_deferred(self, timeout=None):
+        """Each request reports its own outcome, the bulk review has no status of its own to time out"""
+        self()
+
+    def open_review_view(self):
+        self.client_pool.run(self.open_review())
+
+    async def open_review(self):
+        client = self.client_pool.get_async_client(self.token)
+        try:
+            pending = await get_pending_requests(client, self.channel)
+            await client.views_open(trigger_id=self.payload["trigger_id"], view=self.construct_review_modal(pending))
+        except errors.SlackApiError as e:
+            logger.error(e, stack_info=True, exc_info=True)
+
+    async def get_pending(self):
+        return await get_pending_requests(self.client_pool.get_async_client(self.token), self.channel)
+
+    def construct_review_modal(self, pending):
+        if not pending:
+            return {
+                "type": "modal",
+                "title": {"type": "plain_text", "text": "Pending requests"},
+                "close": {"type": "plain_text", "text": "Close"},
+                "blocks": [{"type": "section", "text": {"type": "mrkdwn", "text": "No pending requests."}}],
+            }
+        options = [
+            {"text": {"type": "plain_text", "text": entry["title"]}, "value": entry["ts"]}
+            for entry in pending[:MAX_OPTIONS]
+        ]
+        actions = [{"text": {"type": "plain_text", "text": text}, "value": value} for value, text in BULK_ACTIONS.items()]
+        return {
+            "type": "modal",
+            "callback_id": BULK_MODAL,
+            "private_metadata": json.dumps({"channel": self.channel}),
+            "title": {"type": "plain_text", "text": "Pending requests"},
+            "submit": {"type": "plain_text", "text": "Submit"},
+            "blocks": [
+                {
+                    "type": "input",
+                    "block_id": "requests_block",
+                    "label": {"type": "plain_text", "text": f"Requests ({len(pending)} pending)"},
+                    "element": {"type": "multi_static_select", "action_id": "requests_input", "options": options},
+                },
+                {
+                    "type": "input",
+                    "block_id": "action_block",
+                    "label": {"type": "plain_text", "text": "Action"},
+                    "element": {"type": "radio_buttons", "action_id": "action_input",
+                                "options": actions, "initial_option": actions[0]},
+                },
+                {
+                    "type": "input",
+                    "block_id": "reason_block",
+                    "optional": True,
+                    "label": {"type": "plain_text", "text": "Reason for rejection"},
+                    "element": {"type": "plain_text_input", "action_id": "reason_input"},
+                },
+            ],
+        }
+
+    @instrumented("bulk.review")
+    def review(self):
+        """Provisions the selected requests and returns [{ts, action, exception}]"""
+        values = self.payload["view"]["state"]["values"]
+        selected = [option["value"] for option in values["requests_block"]["requests_input"]["selected_options"]]
+        action_id = values["action_block"]["action_input"]["selected_option"]["value"]
+        reason = (values.get("reason_block", {}).get("reason_input") or {}).get("value")
+        # A retried submission runs nothing twice, each request is also claimed on its own
+        key = f"bulk:{self.payload['view']['id']}"
+        if self.idempotency_guard.claim(key) is not None:
+            return self.results
+
+        try:
+            pending = {entry["ts"]: entry for entry in self.client_pool.run(self.get_pending())}
+        except errors.SlackApiError as e:
+            # Nothing was run, a resubmission can try again
+            self.idempotency_guard.release(key)
+            logger.error(e, stack_info=True, exc_info=True)
+            return self.results
+
+        provisions = []
+        for ts in selected:
+            if ts not in pending:
+                self.results.append({"ts": ts, "action": "Not pending", "exception": None})
+                continue
+            try:
+                provision = self.get_provision(pending[ts], action_id)
+            except Exception as e:
+                logger.error(e, stack_info=True, exc_info=True)
+                self.results.append({"ts": ts, "action": action_id, "exception": str(e)})
+                continue
+            if provision.action_id != action_id:
+                self.results.append({"ts": ts, "action": provision.action_id, "exception": None})
+                continue
+            provision.reason = reason
+            provisions.append(provision)
+
+        if provisions:
+            self.client_pool.run(self.provision_all(provisions, action_id, reason))
+        for provision in provisions:
+            exception = str(provision.exception) if provision.exception else None
+            self.idempotency_guard.complete(provision.idempotency_key, {"action": action_id, "exception": exception})
+            self.results.append({"ts": provision.approvers_ts, "action": action_id, "exception": exception})
+        self.send_summary(action_id)
+        self.idempotency_guard.complete(key, {"action": action_id, "results": self.results})
+        return self.results
+
+    def get_provision(self, entry, action_id):
+        """Builds the provision of a pending message as if its button was clicked"""
+        from slack_approval.registry import get_provision_class
+        from slack_approval.slack_provision import SlackProvision
+
+        payload = {
+            "type": "block_actions",
+            "team": self.payload.get("team"),
+            "user": self.payload["user"],
+            "trigger_id": None,
+            "response_url": None,
+            "channel": {"id": self.channel},
+            "message": {"ts": entry["ts"]},
+            "container": {"message_ts": entry["ts"]},
+            "actions": [{"action_id": action_id, "value": entry["value"]}],
+        }
+        provision = SlackProvision(StoredRequest({"payload": json.dumps(payload)}, self.headers),
+                                   client_pool=self.client_pool, user_cache=self.user_cache,
+                                   state_store=self.state_store, idempotency_guard=self.idempotency_guard)
+        if provision.action_id == "Not allowed":
+            return provision
+        try:
+            provision.__class__ = (self.resolve or get_provision_class)(provision.name)
+        except Exception:
+            provision.release_interaction()
+            raise
+        provision.channel_id = self.channel
+        return provision
+
+    async def provision_all(self, provisions, action_id, reason):
+        import asyncio
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def provision_one(provision):
+            hook = provision.approved if action_id == "Approved" else provision.rejected
+            async with semaphore:
+                try:
+                    with timer(f"provision.{PAST_TENSE[action_id].lower()}", provision_class=provision.name):
+                        await provision.run_hook(hook)
+                except Exception as e:
+                    provision.exception = e
+                    logger.error(e, stack_info=True, exc_info=True)
+
+        async def bounded(coroutine):
+            async with semaphore:
+                return await coroutine
+
+        await asyncio.gather(*[provision_one(provision) for provision in provisions])
+
+        summary = f"{PAST_TENSE[action_id]} in bulk with {len(provisions) - 1} other requests"
+        if action_id == "Reject Response":
+            summary += f", reason for rejection: {reason}"
+        updates = []
+        for provision in provisions:
+            for coroutine in provision.get_status_coroutines(status=action_id, mention_requester=True,
+                                                             thread_message=summary):
+                updates.append((provision, bounded(coroutine)))
+        results = await asyncio.gather(*[coroutine for _, coroutine in updates], return_exceptions=True)
+        for (provision, _), result in zip(updates, results):
+            if isinstance(result, Exception):
+                provision.exception = result
+                logger.error(result, exc_info=result)
+
+    def send_summary(self, action_id):
+        """One ephemeral message to the approver with the outcome of the whole batch"""
+        done = sum(1 for result in self.results if result["action"] == action_id and not result["exception"])
+        failed = sum(1 for result in self.results if result["action"] == action_id and result["exception"])
+        skipped = len(self.results) - done - failed
+        text = f"{PAST_TENSE[action_id]} {done} requests"
+        if failed:
+            text += f", {failed} failed"
+        if skipped:
+            text += f", {skipped} skipped (already handled or not allowed)"
+        self.client_pool.run(self.post_summary(text))
+
+    async def post_summary(self, text):
+        try:
+            client = self.client_pool.get_async_client(self.token)
+            await client.chat_postEphemeral(channel=self.channel, user=self.payload["user"]["id"], text=text)
+        except errors.SlackApiError as e:
+            logger.error(e, stack_info=True, exc_info=True)
@@ -0,0 +1,61 @@
+import threading
+
+from slack_approval.stores import MemoryStore
+
+
+class UserCache:
+    """Caches email -> user id and user id -> email lookups.
+
+    Any store with get/set (see slack_approval.stores) can back it, ie. a
+    SQLiteStore on a shared path so warm and cold instances share results.
+    """
+
+    def __init__(self, store=None, ttl=3600, max_size=1024):
+        self.store = store or MemoryStore(ttl=ttl, max_size=max_size)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get_user_id(self, email):
+        return self._get(f"email:{email}")
+
+    def get_email(self, user_id):
+        return self._get(f"user:{user_id}")
+
+    def set_user(self, user_id, email):
+        if email:
+            self.store.set(f"email:{email}", user_id, ttl=self.ttl)
+        if user_id:
+            self.store.set(f"user:{user_id}", email, ttl=self.ttl)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    def _get(self, key):
+        value = self.store.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_user_cache():
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = UserCache()
+    return _default_cache
+
+
+def set_default_user_cache(cache):
+    global _default_cache
+    with _default_cache_lock:
+        _default_cache = cache
@@ -1,6 +1,15 @@
 import click
+import json
 import shutil
 import os
+import subprocess
+import sys
+import time
+
+ENTRY_POINTS = {
+    "request": "slack_approval.slack_request",
+    "provision": "slack_approval.slack_provision",
+}
 
 
 @click.group()
@@ -16,5 +25,175 @@ def init():
     shutil.copytree(f"{dir_path}/functions", f"{os.getcwd()}/functions")
 
 
+def measure_import_time(module, cwd=None):
+    """Imports module in a fresh interpreter, returns [(module, self_us, cumulative_us, depth)]"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise click.ClickException(f"importing {module} failed:\n{result.stderr.splitlines()[-1]}")
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        timings.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return timings
+
+
+@main.command("import-time")
+@click.option("--functions-dir", default=None,
+              help="Measure the deployed request.py and provision.py in this folder instead of the library modules")
+@click.option("--budget", default=500, show_default=True, help="Maximum import time per entry point in ms")
+@click.option("--top", default=15, show_default=True, help="Number of slowest modules to list")
+def import_time(functions_dir, budget, top):
+    """Reports the import time breakdown of the entry points and fails if they exceed the budget
+    """
+    over_budget = []
+    for entry_point, module in ENTRY_POINTS.items():
+        if functions_dir:
+            module = entry_point
+        timings = measure_import_time(module, cwd=functions_dir)
+        total_ms = next(cumulative for name, _, cumulative, _ in timings if name == module) / 1000
+        click.echo(f"{entry_point} ({module}): {total_ms:.1f} ms, budget {budget} ms")
+        # Only the top levels of the import tree, nested modules are included in their parent
+        slowest = sorted((t for t in timings if t[3] <= 2 and t[0] != module), key=lambda t: -t[2])
+        for name, self_us, cumulative_us, depth in slowest[:top]:
+            click.echo(f"  {cumulative_us / 1000:8.1f} ms {self_us / 1000:8.1f} ms self  {'  ' * depth}{name}")
+        if total_ms > budget:
+            over_budget.append(entry_point)
+    if over_budget:
+        raise click.ClickException(f"import time over budget for: {', '.join(over_budget)}")
+
+
+INTERACTION_TYPES = ("block_actions", "view_submission")
+
+
+def load_records(path):
+    """Reads a json list or json lines of request bodies and interaction payloads"""
+    with open(path) as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        records = json.loads(text)
+    else:
+        records = [json.loads(line) for line in text.splitlines() if line.strip()]
+    for record in records:
+        if record.get("type") not in INTERACTION_TYPES and "provision_class" not in record:
+            raise click.ClickException(f"not a request body or interaction payload: {json.dumps(record)[:200]}")
+    return records
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+@main.command()
+@click.argument("records_file", type=click.Path(exists=True, dir_okay=False))
+@click.option("--provision-class", default=None,
+              help="SlackProvision subclass to drive interactions through, as module:Class")
+@click.option("--concurrency", default=1, show_default=True, help="Records replayed at once")
+@click.option("--repeat", default=1, show_default=True, help="Times to replay the whole file")
+@click.option("--signing-secret", default="replay-secret", show_default=True)
+@click.option("--latency", default=0.0, show_default=True, help="Fake Slack latency per call in seconds")
+@click.option("--rate-limit-rate", default=0.0, show_default=True, help="Fraction of calls answered with 429")
+@click.option("--error-rate", default=0.0, show_default=True, help="Fraction of calls answered with an error")
+@click.option("--paced", is_flag=True, help="Keep Slack's rate limits in the scheduler")
+@click.option("--dedupe", is_flag=True, help="Skip repeated interactions like a deployment would")
+def replay(records_file, provision_class, concurrency, repeat, signing_secret, latency, rate_limit_rate,
+           error_rate, paced, dedupe):
+    """Replays recorded requests and interactions against a local fake Slack API,
+    reporting throughput and latency
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from types import SimpleNamespace
+
+    from slack_approval.clients import SlackClientPool, set_default_pool
+    from slack_approval.fake_slack import FakeSlackServer, signed_interaction
+    from slack_approval.idempotency import IdempotencyGuard, get_default_guard
+    from slack_approval.rate_limit import METHOD_LIMITS, SlackScheduler
+    from slack_approval.registry import get_provision_class, register_lazy
+    from slack_approval.signature import is_signed_request
+    from slack_approval.slack_provision import SlackProvision
+    from slack_approval.slack_request import AsyncSlackRequest
+
+    records = load_records(records_file) * repeat
+    cls = SlackProvision
+    if provision_class:
+        sys.path.insert(0, os.getcwd())
+        register_lazy("replay", provision_class)
+        cls = get_provision_class("replay")
+
+    os.environ.setdefault("SLACK_BOT_TOKEN", "xoxb-replay")
+    for record in records:
+        for name in ("APPROVERS_CHANNEL", "REQUESTERS_CHANNEL", record.get("approvers_channel"),
+                     record.get("requesters_channel")):
+            if name:
+                os.environ.setdefault(name, f"C{name.upper()}")
+
+    def run_request(record):
+        slack_request = AsyncSlackRequest(SimpleNamespace(json=dict(record)))
+        slack_request.send_request_message()
+        return "request", slack_request.exception
+
+    def run_interaction(record):
+        guard = get_default_guard() if dedupe else IdempotencyGuard()
+        request = signed_interaction(record, signing_secret)
+        if not is_signed_request(request.headers, request.get_data(), [signing_secret]):
+            raise click.ClickException("signature check failed")
+        slack_provision = SlackProvision(request, idempotency_guard=guard)
+        slack_provision.__class__ = cls
+        slack_provision()
+        return slack_provision.action_id, slack_provision.exception
+
+    def timed(record):
+        start = time.perf_counter()
+        try:
+            kind, exception = (run_interaction if record.get("type") in INTERACTION_TYPES else run_request)(record)
+        except click.ClickException:
+            raise
+        except Exception as e:
+            kind, exception = record.get("type", "request"), e
+        return kind, exception, time.perf_counter() - start
+
+    server = FakeSlackServer(latency=latency, rate_limit_rate=rate_limit_rate, error_rate=error_rate,
+                             retry_after=0.1, seed=0).start()
+    scheduler = SlackScheduler()
+    if not paced:
+        scheduler = SlackScheduler(method_limits={method: 10 ** 9 for method in METHOD_LIMITS},
+                                   channel_limit=10 ** 9)
+    pool = SlackClientPool(base_url=server.base_url, scheduler=scheduler)
+    set_default_pool(pool)
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(timed, records))
+        elapsed = time.perf_counter() - start
+    finally:
+        pool.close()
+        server.stop()
+
+    by_kind = {}
+    for kind, exception, seconds in results:
+        by_kind.setdefault(kind, []).append((exception, seconds))
+    click.echo(f"{len(results)} records in {elapsed:.2f}s, {len(results) / elapsed:.1f}/s at concurrency {concurrency}")
+    for kind, entries in sorted(by_kind.items()):
+        latencies = [seconds for _, seconds in entries]
+        errors = sum(1 for exception, _ in entries if exception is not None)
+        click.echo(
+            f"  {kind:>16} n={len(entries):<5} "
+            f"p50={percentile(latencies, 50) * 1000:7.1f}ms "
+            f"p90={percentile(latencies, 90) * 1000:7.1f}ms "
+            f"p99={percentile(latencies, 99) * 1000:7.1f}ms errors={errors}"
+        )
+    calls = ", ".join(f"{method}={count}" for method, count in sorted(server.calls.items()))
+    click.echo(f"slack calls: {calls or 'none'}")
+    click.echo(f"scheduler: {scheduler.stats()}")
+
+
 if __name__ == "__main__":
     main()
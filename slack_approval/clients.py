@@ -0,0 +1,188 @@
+import logging
+import ssl
+import threading
+
+from slack_approval.rate_limit import AsyncScheduledClient, ScheduledClient, SlackScheduler
+
+logger = logging.getLogger("slack_clients")
+logger.setLevel(logging.DEBUG)
+
+
+class SlackClientPool:
+    """Keeps Slack clients alive per token so warm invocations reuse them.
+
+    Async clients share one aiohttp session with keep-alive connections per
+    token and event loop; use `run` to execute coroutines on the pool's
+    long-lived loop so those connections survive between invocations. The
+    library's own Slack calls all go through them.
+
+    Sync clients (`get_client`) are kept for provision classes that call Slack
+    themselves. They share a single SSL context, but urllib still opens a new
+    connection per call.
+
+    Every client call goes through the pool's SlackScheduler, which paces it
+    against Slack's rate limits. Webhook clients for response_urls aren't
+    Web API calls, they share one aiohttp session per event loop instead.
+    """
+
+    def __init__(self, base_url="https://www.slack.com/api/", timeout=30, ssl_context=None,
+                 keepalive_timeout=75, connection_limit=100, scheduler=None):
+        self.scheduler = scheduler or SlackScheduler()
+        self.base_url = base_url
+        self.timeout = timeout
+        self.ssl = ssl_context or ssl.create_default_context()
+        self.keepalive_timeout = keepalive_timeout
+        self.connection_limit = connection_limit
+        self._clients = {}
+        self._async_clients = {}
+        self._webhook_sessions = {}
+        self._loops = set()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def get_client(self, token):
+        client = self._clients.get(token)
+        if client is None:
+            from slack_sdk import WebClient
+
+            with self._lock:
+                client = self._clients.get(token)
+                if client is None:
+                    client = ScheduledClient(WebClient(
+                        token=token,
+                        base_url=self.base_url,
+                        timeout=self.timeout,
+                        ssl=self.ssl,
+                    ), self.scheduler)
+                    self._clients[token] = client
+        return client
+
+    def get_async_client(self, token):
+        """Must be called from a running event loop"""
+        # aiohttp is slow to import, only load it on the async path
+        import asyncio
+        import aiohttp
+        from slack_sdk.web.async_client import AsyncWebClient
+
+        loop = asyncio.get_running_loop()
+        key = (token, id(loop))
+        with self._lock:
+            self._prune_closed_loops()
+            entry = self._async_clients.get(key)
+            if entry is None:
+                session = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(
+                        ssl=self.ssl,
+                        limit=self.connection_limit,
+                        keepalive_timeout=self.keepalive_timeout,
+                    )
+                )
+                client = AsyncWebClient(
+                    token=token,
+                    base_url=self.base_url,
+                    timeout=self.timeout,
+                    session=session,
+                )
+                entry = (loop, AsyncScheduledClient(client, self.scheduler))
+                self._async_clients[key] = entry
+        return entry[1]
+
+    def get_webhook_client(self, url):
+        """Webhook client for an interaction's response_url, must be called from a running event loop"""
+        import asyncio
+        import aiohttp
+        from slack_sdk.webhook.async_client import AsyncWebhookClient
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._prune_closed_loops()
+            entry = self._webhook_sessions.get(id(loop))
+            if entry is None:
+                session = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(
+                        ssl=self.ssl,
+                        limit=self.connection_limit,
+                        keepalive_timeout=self.keepalive_timeout,
+                    )
+                )
+                entry = (loop, session)
+                self._webhook_sessions[id(loop)] = entry
+        # Each response_url is used a handful of times, only the session is worth keeping
+        return AsyncWebhookClient(url, timeout=self.timeout, session=entry[1])
+
+    def run(self, coro):
+        """Runs a coroutine on this thread's long-lived loop"""
+        import asyncio
+
+        loop = getattr(self._local, "loop", None)
+        if loop is None or loop.is_closed():
+            loop = asyncio.new_event_loop()
+            self._local.loop = loop
+            with self._lock:
+                self._loops.add(loop)
+        return loop.run_until_complete(coro)
+
+    def close_thread(self):
+        """Closes the loop `run` created for the current thread and its sessions,
+        for short lived threads like the progress reporter's"""
+        loop = getattr(self._local, "loop", None)
+        if loop is None:
+            return
+        self._local.loop = None
+        with self._lock:
+            keys = [key for key, (entry_loop, _) in self._async_clients.items() if entry_loop is loop]
+            sessions = [self._async_clients.pop(key)[1].session for key in keys]
+            keys = [key for key, (entry_loop, _) in self._webhook_sessions.items() if entry_loop is loop]
+            sessions.extend(self._webhook_sessions.pop(key)[1] for key in keys)
+            self._loops.discard(loop)
+        if not loop.is_closed() and not loop.is_running():
+            for session in sessions:
+                loop.run_until_complete(session.close())
+            loop.close()
+
+    def close(self):
+        """Closes the sessions of this pool and the loops it created with `run`.
+        Loops of other pools, ie. when running on a workspace pool's loop, are left open"""
+        with self._lock:
+            sessions = [(loop, client.session) for loop, client in self._async_clients.values()]
+            sessions.extend(self._webhook_sessions.values())
+            loops = set(self._loops)
+            self._async_clients.clear()
+            self._webhook_sessions.clear()
+            self._clients.clear()
+            self._loops.clear()
+        for loop, session in sessions:
+            if loop.is_closed() or loop.is_running():
+                continue
+            loop.run_until_complete(session.close())
+        for loop in loops:
+            if not loop.is_closed() and not loop.is_running():
+                loop.close()
+
+    def _prune_closed_loops(self):
+        # Clients bound to a loop closed by `asyncio.run` can't be reused
+        for key in [k for k, (loop, _) in self._async_clients.items() if loop.is_closed()]:
+            logger.debug("dropping async slack client bound to a closed loop")
+            del self._async_clients[key]
+        for key in [k for k, (loop, _) in self._webhook_sessions.items() if loop.is_closed()]:
+            del self._webhook_sessions[key]
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_default_pool():
+    global _default_pool
+    if _default_pool is None:
+        with _default_pool_lock:
+            if _default_pool is None:
+                _default_pool = SlackClientPool()
+    return _default_pool
+
+
+def set_default_pool(pool):
+    """Replaces the process-wide pool, ie. to point clients at a different base_url"""
+    global _default_pool
+    with _default_pool_lock:
+        _default_pool = pool
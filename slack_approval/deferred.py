@@ -0,0 +1,139 @@
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty, Queue
+
+logger = logging.getLogger("slack_deferred")
+logger.setLevel(logging.DEBUG)
+
+DEFERRED_ACTIONS = ("Approved", "Reject Response")
+
+
+class StoredRequest:
+    """Minimal stand-in for the flask request SlackProvision is built from"""
+
+    def __init__(self, form, headers, data=b""):
+        self.form = form
+        self.headers = headers
+        self.data = data
+
+    def get_data(self):
+        return self.data
+
+
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+
+
+def get_worker_pool():
+    """Threads that run deferred actions under the watchdog. They are reused so
+    each keeps its client pool event loop and sessions warm instead of leaking new ones"""
+    global _worker_pool
+    if _worker_pool is None:
+        with _worker_pool_lock:
+            if _worker_pool is None:
+                _worker_pool = ThreadPoolExecutor(thread_name_prefix="provision-worker")
+    return _worker_pool
+
+
+class ThreadRunner:
+    """Runs deferred actions in an in-process executor.
+    On Cloud Functions this needs CPU allocated after the response is sent."""
+
+    def __init__(self, max_workers=4, timeout=None):
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="provision")
+
+    def submit(self, slack_provision):
+        return self.executor.submit(slack_provision.run_deferred, self.timeout)
+
+
+class QueueRunner:
+    """Serializes the interaction into a queue that a worker drains with `work`"""
+
+    def __init__(self, queue, timeout=None):
+        self.queue = queue
+        self.timeout = timeout
+
+    def submit(self, slack_provision):
+        self.queue.put({
+            "provision_class": slack_provision.name,
+            "form": {"payload": json.dumps(slack_provision.payload)},
+            "headers": dict(slack_provision.headers),
+        })
+
+    def work(self, resolve=None, max_jobs=None, wait=0):
+        """Runs queued actions. `resolve` maps a provision_class to its class,
+        the provision class registry by default"""
+        from slack_approval.idempotency import IdempotencyGuard
+        from slack_approval.registry import get_provision_class
+        from slack_approval.slack_provision import SlackProvision
+
+        resolve = resolve or get_provision_class
+        # Jobs were deduplicated when they were queued, the worker's own guard only tracks this run
+        guard = IdempotencyGuard()
+
+        done = 0
+        while max_jobs is None or done < max_jobs:
+            job = self.queue.pop(wait)
+            if job is None:
+                break
+            try:
+                slack_provision = SlackProvision(StoredRequest(job["form"], job["headers"]), idempotency_guard=guard)
+                slack_provision.__class__ = resolve(job["provision_class"])
+                slack_provision.run_deferred(self.timeout)
+            except Exception as e:
+                logger.error(e, stack_info=True, exc_info=True)
+            done += 1
+        return done
+
+
+class MemoryQueue:
+    def __init__(self):
+        self._queue = Queue()
+
+    def put(self, job):
+        self._queue.put(job)
+
+    def pop(self, wait=0):
+        try:
+            return self._queue.get(timeout=wait) if wait else self._queue.get_nowait()
+        except Empty:
+            return None
+
+
+class SQLiteQueue:
+    """Local queue that survives restarts, stand-in for a managed queue"""
+
+    def __init__(self, path, table="provision_jobs"):
+        import sqlite3
+
+        self.table = table
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY AUTOINCREMENT, job TEXT)"
+        )
+
+    def put(self, job):
+        with self._lock:
+            self._connection.execute(f"INSERT INTO {self.table} (job) VALUES (?)", (json.dumps(job),))
+
+    def pop(self, wait=0):
+        deadline = time.time() + wait
+        while True:
+            with self._lock:
+                self._connection.execute("BEGIN IMMEDIATE")
+                row = self._connection.execute(
+                    f"SELECT id, job FROM {self.table} ORDER BY id LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    self._connection.execute(f"DELETE FROM {self.table} WHERE id = ?", (row[0],))
+                self._connection.execute("COMMIT")
+            if row is not None:
+                return json.loads(row[1])
+            if time.time() >= deadline:
+                return None
+            time.sleep(0.1)
@@ -0,0 +1,263 @@
+"""Digest mode: requests of high volume, low risk provision classes are buffered
+and posted to the approvers channel as one message, a compact row per request
+with its own Approve and Reject buttons.
+
+Classes opt in with `configure` or the DIGEST_CLASSES env var, ie.
+'{"Provision Service": {"window": 300, "max_size": 20}}'. A buffer is posted
+once it holds `max_size` requests, or with the first request after `window`
+seconds. `flush_due` posts the expired buffers, call it on a schedule so a
+quiet buffer isn't left waiting.
+
+The request and provision functions must share the store, set DIGEST_DB to a
+SQLite path.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+from slack_sdk import errors
+
+from slack_approval.registry import get_class_key
+from slack_approval.state import DEFAULT_TTL
+from slack_approval.stores import MemoryStore
+from slack_approval.utils import DIVIDER, HIDDEN_INPUTS, get_accepted_button, get_label, get_rejected_button
+
+DEFAULT_WINDOW = 300
+# 50 blocks per message: header and divider, then a summary and a buttons or status block per row
+MAX_ROWS = 24
+MAX_SUMMARY_CHARS = 300
+ROW_BLOCK_PREFIX = "digest_row_"
+BUFFERS_KEY = "digest:buffers"
+
+logger = logging.getLogger("slack_digest")
+logger.setLevel(logging.DEBUG)
+
+
+class DigestBuffer:
+    """Open buffers live under a single store key and each posted digest under its
+    own, every change is one atomic store update so instances sharing DIGEST_DB
+    can't lose requests or row statuses"""
+
+    def __init__(self, store=None, classes=None, ttl=DEFAULT_TTL):
+        self.store = store or MemoryStore(max_size=None)
+        self.classes = {}
+        self.ttl = ttl
+        for name, options in (classes or {}).items():
+            self.configure(name, **options)
+
+    def configure(self, name, window=DEFAULT_WINDOW, max_size=MAX_ROWS):
+        self.classes[get_class_key(name)] = {"window": window, "max_size": min(max_size, MAX_ROWS)}
+
+    def is_digest(self, name):
+        return get_class_key(name) in self.classes
+
+    def add(self, channel, name, entry, now=None, team_id=None):
+        """Buffers a request's {"summary", "value"}. Returns the buffered entries
+        if the buffer is due and was taken for posting, otherwise None"""
+        now = now or time.time()
+        key = f"{channel}:{get_class_key(name)}"
+        options = self.classes[get_class_key(name)]
+
+        def append(buffers):
+            buffers = buffers or {}
+            buffer = buffers.setdefault(key, {
+                "channel": channel, "name": name, "team_id": team_id, "started": now, "entries": []
+            })
+            buffer["entries"].append(entry)
+            if len(buffer["entries"]) >= options["max_size"] or now - buffer["started"] >= options["window"]:
+                return buffers or None, _take(buffers, key, options["max_size"])
+            return buffers, None
+
+        return self.store.update(BUFFERS_KEY, append, ttl=self.ttl)
+
+    def take_due(self, now=None):
+        """Removes and returns the buffers whose window elapsed, [(channel, name, entries, team_id)]"""
+        now = now or time.time()
+
+        def take(buffers):
+            buffers = buffers or {}
+            due = []
+            for key, buffer in list(buffers.items()):
+                options = self.classes.get(get_class_key(buffer["name"]), {})
+                if now - buffer["started"] >= options.get("window", 0):
+                    entries = _take(buffers, key, options.get("max_size", MAX_ROWS))
+                    due.append((buffer["channel"], buffer["name"], entries, buffer.get("team_id")))
+            return buffers or None, due
+
+        return self.store.update(BUFFERS_KEY, take, ttl=self.ttl)
+
+    def restore(self, channel, name, entries, team_id=None):
+        """Puts back the entries of a digest that failed to post, ahead of the requests
+        buffered since. The buffer is due right away, the next add or flush_due retries it"""
+        key = f"{channel}:{get_class_key(name)}"
+
+        def put_back(buffers):
+            buffers = buffers or {}
+            buffer = buffers.setdefault(key, {
+                "channel": channel, "name": name, "team_id": team_id, "started": 0, "entries": []
+            })
+            buffer["started"] = 0
+            buffer["entries"] = entries + buffer["entries"]
+            return buffers, None
+
+        self.store.update(BUFFERS_KEY, put_back, ttl=self.ttl)
+
+    def save_digest(self, channel, ts, name, rows):
+        self.store.set(f"digest:message:{channel}:{ts}", {"name": name, "rows": rows}, ttl=self.ttl)
+
+    def set_row_status(self, channel, ts, row, status):
+        """Replaces the buttons of a row with its status, returns the digest to send with `send_digest`"""
+
+        def replace(digest):
+            if digest is None:
+                raise KeyError(f"Digest {channel}/{ts} not found or expired")
+            digest["rows"][row]["status"] = status
+            digest["version"] = digest.get("version", 0) + 1
+            return digest, digest
+
+        return self.store.update(f"digest:message:{channel}:{ts}", replace, ttl=self.ttl)
+
+    async def send_digest(self, channel, ts, digest, send):
+        """Sends the digest blocks with `send(blocks)`, again as long as another row changed meanwhile.
+        Concurrent updates of the message can land out of order, the last one to land is always
+        followed by a send of the latest rows"""
+        while True:
+            # MemoryStore hands out the stored dict, take the version before it can change
+            version = digest.get("version", 0)
+            await send(get_digest_blocks(digest["name"], digest["rows"]))
+            digest = self.store.get(f"digest:message:{channel}:{ts}")
+            if digest is None or digest.get("version", 0) == version:
+                return
+
+
+def _take(buffers, key, max_size):
+    """Removes up to max_size entries of a buffer for posting, a restored buffer can hold more"""
+    buffer = buffers[key]
+    entries, buffer["entries"] = buffer["entries"][:max_size], buffer["entries"][max_size:]
+    if not buffer["entries"]:
+        del buffers[key]
+    return entries
+
+
+def get_summary(inputs):
+    fields = [f"*{get_label(key)}:* {value}" for key, value in inputs.items() if key not in HIDDEN_INPUTS]
+    summary = " · ".join(fields)
+    if len(summary) > MAX_SUMMARY_CHARS:
+        summary = summary[:MAX_SUMMARY_CHARS - 1] + "…"
+    return summary
+
+
+def get_row_status(status, user, exception=None):
+    text = f"*Status: {status} by {user}*"
+    if exception:
+        text += f" · Error while provisioning: {exception}"
+    return text
+
+
+def get_digest_blocks(name, rows):
+    pending = sum(1 for row in rows if row["status"] is None)
+    blocks = [
+        {
+            "type": "header",
+            "text": {"type": "plain_text", "text": f"{name} ({pending}/{len(rows)} pending)", "emoji": True},
+        },
+        DIVIDER,
+    ]
+    for number, row in enumerate(rows):
+        blocks.append({"type": "section", "text": {"type": "mrkdwn", "text": row["summary"]}})
+        if row["status"] is None:
+            blocks.append({
+                "type": "actions",
+                "block_id": f"{ROW_BLOCK_PREFIX}{number}",
+                "elements": [get_accepted_button(row["value"]), get_rejected_button(row["value"])],
+            })
+        else:
+            blocks.append({"type": "context", "elements": [{"type": "mrkdwn", "text": row["status"]}]})
+    return blocks
+
+
+async def post_digest(client, channel, name, entries, digest_buffer, state_store=None, team_id=None):
+    """Posts one approvers message for the buffered requests and returns its ts.
+    If it fails the entries go back in the buffer and the error is raised"""
+    from slack_approval.state import dump_state
+
+    rows = [
+        {
+            "summary": entry["summary"],
+            "value": dump_state(dict(entry["value"], digest_row=number), state_store),
+            "status": None,
+        }
+        for number, entry in enumerate(entries)
+    ]
+    try:
+        response = await client.chat_postMessage(channel=channel, text="fallback", blocks=get_digest_blocks(name, rows))
+    except errors.SlackApiError:
+        digest_buffer.restore(channel, name, entries, team_id)
+        raise
+    digest_buffer.save_digest(channel, response["ts"], name, rows)
+    return response["ts"]
+
+
+def flush_due(client_pool=None, state_store=None, digest_buffer=None, token=None):
+    """Posts every buffer whose window elapsed, returns the number of digests posted"""
+    import asyncio
+
+    from slack_approval.clients import get_default_pool
+    from slack_approval.state import get_default_state_store
+    from slack_approval.workspaces import get_default_router
+
+    router = get_default_router()
+    client_pool = client_pool or get_default_pool()
+    state_store = state_store or get_default_state_store()
+    digest_buffer = digest_buffer or get_default_digest_buffer()
+    token = token or os.environ.get("SLACK_BOT_TOKEN")
+    due = digest_buffer.take_due()
+    if not due:
+        return 0
+
+    def get_client(team_id):
+        workspace = router.for_team(team_id) if router is not None else None
+        if workspace is not None:
+            return workspace.client_pool.get_async_client(workspace.token)
+        return client_pool.get_async_client(token)
+
+    async def post_all():
+        return await asyncio.gather(*[
+            post_digest(get_client(team_id), channel, name, entries, digest_buffer, state_store, team_id)
+            for channel, name, entries, team_id in due
+        ], return_exceptions=True)
+
+    posted = 0
+    for result in client_pool.run(post_all()):
+        if isinstance(result, Exception):
+            logger.error(result, exc_info=result)
+        elif result is not None:
+            posted += 1
+    return posted
+
+
+_default_buffer = None
+_default_buffer_lock = threading.Lock()
+
+
+def get_default_digest_buffer():
+    """Configured from DIGEST_CLASSES, in memory unless DIGEST_DB is set"""
+    global _default_buffer
+    if _default_buffer is None:
+        with _default_buffer_lock:
+            if _default_buffer is None:
+                store = None
+                if os.environ.get("DIGEST_DB"):
+                    from slack_approval.stores import SQLiteStore
+
+                    store = SQLiteStore(os.environ["DIGEST_DB"], table="digests")
+                _default_buffer = DigestBuffer(store, json.loads(os.environ.get("DIGEST_CLASSES", "{}")))
+    return _default_buffer
+
+
+def set_default_digest_buffer(digest_buffer):
+    global _default_buffer
+    with _default_buffer_lock:
+        _default_buffer = digest_buffer
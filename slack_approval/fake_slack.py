@@ -0,0 +1,212 @@
+"""Local stand-in for the Slack Web API, for benchmarks and offline load tests.
+
+    server = FakeSlackServer(latency=0.05, rate_limit_rate=0.01).start()
+    set_default_pool(SlackClientPool(base_url=server.base_url))
+"""
+import itertools
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+from slack_approval.deferred import StoredRequest
+
+
+RESPONSE_URL_USES = 5
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 stalls concurrent clients on connect retries
+    request_queue_size = 512
+
+
+class FakeSlackServer:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, rate_limit_rate=0.0,
+                 error_rate=0.0, retry_after=1, seed=None):
+        self.latency = latency
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.calls = {}
+        self.messages = {}
+        self.views = {}
+        self.response_url_uses = {}
+        self._ts = itertools.count(1)
+        self._lock = threading.Lock()
+        self.server = _Server((host, port), self._handler())
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/api/"
+
+    def response_url(self, channel, ts):
+        """A response_url that replaces the message, usable 5 times like Slack's"""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/actions/{channel}/{ts}"
+
+    def handle_response_url(self, channel, ts, args):
+        with self._lock:
+            self.calls["response_url"] = self.calls.get("response_url", 0) + 1
+            uses = self.response_url_uses[(channel, ts)] = self.response_url_uses.get((channel, ts), 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+        if uses > RESPONSE_URL_USES:
+            return 404, {}, {"ok": False, "error": "used_url"}
+        if args.get("replace_original"):
+            with self._lock:
+                self.messages[(channel, ts)] = dict(args, channel=channel)
+        return 200, {}, {"ok": True}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls = {}
+
+    def total_calls(self):
+        with self._lock:
+            return sum(self.calls.values())
+
+    def handle(self, method, args):
+        """Returns (status, headers, body) for an API call"""
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            roll = self.random.random()
+        if self.latency:
+            time.sleep(self.latency)
+        if roll < self.rate_limit_rate:
+            return 429, {"Retry-After": str(self.retry_after)}, {"ok": False, "error": "ratelimited"}
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 200, {}, {"ok": False, "error": "internal_error"}
+
+        if method in ("chat.postMessage", "chat.update"):
+            with self._lock:
+                ts = args.get("ts") or f"{int(time.time())}.{next(self._ts):06d}"
+                if method == "chat.postMessage" and args.get("thread_ts"):
+                    return 200, {}, {"ok": True, "channel": args.get("channel"), "ts": ts}
+                self.messages[(args.get("channel"), ts)] = args
+            return 200, {}, {"ok": True, "channel": args.get("channel"), "ts": ts}
+        if method == "views.open":
+            with self._lock:
+                view_id = f"V{next(self._ts)}"
+                self.views[args.get("trigger_id")] = dict(args.get("view"), id=view_id)
+            return 200, {}, {"ok": True, "view": {"id": view_id}}
+        if method == "conversations.history":
+            channel, limit = args.get("channel"), int(args.get("limit", 100))
+            with self._lock:
+                messages = [
+                    dict(message, ts=ts) for (message_channel, ts), message in self.messages.items()
+                    if message_channel == channel
+                ]
+            messages.sort(key=lambda message: message["ts"], reverse=True)
+            return 200, {}, {"ok": True, "messages": messages[:limit], "has_more": len(messages) > limit}
+        if method == "users.lookupByEmail":
+            email = args.get("email", "")
+            return 200, {}, {"ok": True, "user": {"id": _user_id(email), "profile": {"email": email}}}
+        if method == "users.info":
+            user = args.get("user", "")
+            return 200, {}, {"ok": True, "user": {"id": user, "profile": {"email": f"{user.lower()}@example.com"}}}
+        return 200, {}, {"ok": True}
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                self.respond(url.path, dict(parse_qsl(url.query)))
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    args = json.loads(body or "{}")
+                else:
+                    args = dict(parse_qsl(body))
+                args.update(parse_qsl(url.query))
+                if url.path.startswith("/actions/"):
+                    _, _, channel, ts = url.path.split("/", 3)
+                    self.reply(*fake.handle_response_url(channel, ts, args))
+                    return
+                self.respond(url.path, args)
+
+            def respond(self, path, args):
+                self.reply(*fake.handle(path.rsplit("/", 1)[-1], args))
+
+            def reply(self, status, headers, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def _user_id(email):
+    return "U" + format(zlib.crc32(email.encode()), "08X")
+
+
+def signed_interaction(payload, signing_secret, timestamp=None):
+    """Builds a Slack interaction request for `payload`, signed with `signing_secret`"""
+    from slack_sdk.signature import SignatureVerifier
+
+    form = {"payload": json.dumps(payload)}
+    data = urlencode(form).encode()
+    timestamp = str(int(timestamp or time.time()))
+    signature = SignatureVerifier(signing_secret).generate_signature(timestamp=timestamp, body=data)
+    headers = {"x-slack-request-timestamp": timestamp, "x-slack-signature": signature}
+    return StoredRequest(form, headers, data)
+
+
+def button_interaction(message, action_id, user, channel, ts, block_id=None, response_url=None):
+    """Interaction payload for clicking `action_id` on a posted approvers message,
+    in the last actions block unless `block_id` is given, ie. a digest row.
+    Pass FakeSlackServer.response_url to serve the payload's response_url locally"""
+    actions = [block for block in message["blocks"] if block["type"] == "actions"
+               and (block_id is None or block.get("block_id") == block_id)]
+    button = next(b for b in actions[-1]["elements"] if b["action_id"] == action_id)
+    return {
+        "type": "block_actions",
+        "user": user,
+        "trigger_id": f"trigger.{ts}",
+        "response_url": response_url or f"https://hooks.slack.com/actions/{ts}",
+        "channel": {"id": channel},
+        "message": {"ts": ts},
+        "container": {"message_ts": ts},
+        "actions": [{"action_id": action_id, "value": button["value"]}],
+    }
+
+
+def view_submission(view, user, values):
+    """Interaction payload for submitting a modal opened with views_open"""
+    return {
+        "type": "view_submission",
+        "user": user,
+        "view": {
+            "id": view.get("id"),
+            "callback_id": view["callback_id"],
+            "private_metadata": view["private_metadata"],
+            "state": {"values": values},
+        },
+    }
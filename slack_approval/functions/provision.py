@@ -1,19 +1,59 @@
+import json
 import os
 from goblet import Goblet, goblet_entrypoint, Response
 from slack_approval.slack_provision import SlackProvision
+from slack_approval.bulk import BulkReview, is_bulk_interaction
+from slack_approval.deferred import ThreadRunner
+from slack_approval.registry import get_provision_class, register_many
+from slack_approval.signature import get_signing_secrets, is_signed_for, is_signed_request
 
 app = Goblet(function_name="provision")
 goblet_entrypoint(app)
 
+# Provision classes are imported on first use, map each provision_class to "module:Class"
+register_many({
+    # "Provision LB Endpoint": "provision_lb_endpoint:ProvisionLBEndpoint",
+})
+
+# Set DEFERRED_PROVISION to ack Slack right away and provision in the background
+runner = None
+if os.environ.get("DEFERRED_PROVISION"):
+    timeout = os.environ.get("PROVISION_TIMEOUT")
+    runner = ThreadRunner(timeout=float(timeout) if timeout else None)
+# Bulk submissions provision many requests, they are always acked first and reviewed in the background
+bulk_runner = ThreadRunner(max_workers=2)
+
 
 @app.http()
 def main(request):
     """
     """
-    slack_provision = SlackProvision(request)
-    # validate request using the signature secret
-    if not slack_provision.is_valid_signature(os.environ.get("SIGNING_SECRET")):
+    # Forged or stale requests are rejected on the raw body, before any parsing or Slack call
+    signing_secret = is_signed_request(request.headers, request.get_data(), get_signing_secrets())
+    if signing_secret is None:
         return Response("Forbidden", status_code=403)
 
-    slack_provision.__class__ = globals()[slack_provision.name.replace(" ", "")]
+    payload = json.loads(request.form["payload"])
+    # Signed, but with the secret of another workspace than the one the payload routes to
+    if not is_signed_for(payload, signing_secret):
+        return Response("Forbidden", status_code=403)
+
+    if is_bulk_interaction(payload):
+        bulk_review = BulkReview(request)
+        if bulk_review.is_deferrable():
+            bulk_runner.submit(bulk_review)
+            return Response("", status_code=200)
+        bulk_review()
+        return Response("", status_code=200)
+
+    slack_provision = SlackProvision(request)
+    try:
+        slack_provision.__class__ = get_provision_class(slack_provision.name)
+        if runner is not None and slack_provision.is_deferrable():
+            runner.submit(slack_provision)
+            return Response("", status_code=200)
+    except Exception:
+        # Not handled, don't let the claim turn Slack's retries away
+        slack_provision.release_interaction()
+        raise
     slack_provision()
@@ -1,14 +1,30 @@
+import json
 import os
-from goblet import Goblet, goblet_entrypoint
-from slack_approval.slack_request import SlackRequest
+from goblet import Goblet, goblet_entrypoint, Response
+from slack_approval.digest import flush_due
+from slack_approval.registry import register_many
+from slack_approval.slack_request import AsyncSlackRequest, send_request_batch
 
 app = Goblet(function_name="request")
 goblet_entrypoint(app)
 
+# Provision classes that auto-approval rules can run, same mapping as in provision.py
+register_many({
+    # "Provision LB Endpoint": "provision_lb_endpoint:ProvisionLBEndpoint",
+})
+
 
 @app.http()
 def main(request):
-    """Forwards requests to slack.
+    """Forwards requests to slack. A list of requests is posted as a batch,
+    {"flush_digests": true} posts the digests whose window elapsed
     """
-    slack_request = SlackRequest(request)
+    if isinstance(request.json, dict) and request.json.get("flush_digests"):
+        return Response(json.dumps({"digests": flush_due()}), headers={"Content-Type": "application/json"})
+    if isinstance(request.json, list):
+        results = send_request_batch(
+            request.json, concurrency=int(os.environ.get("BATCH_CONCURRENCY", 10))
+        )
+        return Response(json.dumps(results), headers={"Content-Type": "application/json"})
+    slack_request = AsyncSlackRequest(request)
     slack_request.send_request_message()
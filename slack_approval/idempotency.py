@@ -0,0 +1,68 @@
+import os
+import threading
+import time
+
+from slack_approval.stores import MemoryStore
+
+# Slack retries for a few minutes at most, keep a margin
+DEFAULT_TTL = 3600
+# Actions that change state once per message, any other action is keyed on its trigger or view too
+ONCE_PER_MESSAGE = ("Approved", "Reject Response")
+
+
+class IdempotencyGuard:
+    """Records which interactions were handled so Slack retries and concurrent
+    deliveries of the same interaction are skipped.
+
+    The store must support an atomic `add`, see slack_approval.stores.
+    """
+
+    def __init__(self, store=None, ttl=DEFAULT_TTL):
+        self.store = store or MemoryStore(ttl=ttl, max_size=10000)
+        self.ttl = ttl
+
+    def claim(self, key):
+        """Returns None if the caller should handle the interaction, otherwise
+        the record of the delivery that claimed it first"""
+        if self.store.add(key, {"status": "in progress", "started": time.time()}, ttl=self.ttl):
+            return None
+        return self.store.get(key) or {"status": "in progress"}
+
+    def release(self, key):
+        self.store.delete(key)
+
+    def complete(self, key, result):
+        self.store.set(key, dict(result, status="done"), ttl=self.ttl)
+
+
+def get_idempotency_key(approvers_ts, action_id, payload):
+    key = f"interaction:{approvers_ts}:{action_id}"
+    if action_id in ONCE_PER_MESSAGE:
+        return key
+    view_id = payload.get("view", {}).get("id")
+    return f"{key}:{view_id or payload.get('trigger_id', '')}"
+
+
+_default_guard = None
+_default_guard_lock = threading.Lock()
+
+
+def get_default_guard():
+    """In memory by default, set IDEMPOTENCY_DB to a SQLite path to share it between instances"""
+    global _default_guard
+    if _default_guard is None:
+        with _default_guard_lock:
+            if _default_guard is None:
+                store = None
+                if os.environ.get("IDEMPOTENCY_DB"):
+                    from slack_approval.stores import SQLiteStore
+
+                    store = SQLiteStore(os.environ["IDEMPOTENCY_DB"], table="interactions", ttl=DEFAULT_TTL)
+                _default_guard = IdempotencyGuard(store)
+    return _default_guard
+
+
+def set_default_guard(guard):
+    global _default_guard
+    with _default_guard_lock:
+        _default_guard = guard
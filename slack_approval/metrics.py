@@ -0,0 +1,167 @@
+"""Opt-in instrumentation. Nothing is recorded unless a sink is configured,
+either with `set_sink` or the SLACK_APPROVAL_METRICS env var ("logging" or
+"statsd", the latter using STATSD_HOST/STATSD_PORT).
+
+Set SLACK_APPROVAL_PROFILE_DIR to write a cProfile dump per invocation.
+"""
+import functools
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("slack_metrics")
+logger.setLevel(logging.DEBUG)
+
+_UNSET = object()
+_sink = _UNSET
+
+
+class MemorySink:
+    """Keeps every metric in memory, for tests and benchmarks"""
+
+    def __init__(self):
+        self.timings = {}
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def record(self, kind, name, value, tags):
+        with self._lock:
+            if kind == "counter":
+                self.counters[name] = self.counters.get(name, 0) + value
+            else:
+                getattr(self, f"{kind}s").setdefault(name, []).append(value)
+
+
+class LoggingSink:
+    def __init__(self, level=logging.INFO):
+        self.level = level
+
+    def record(self, kind, name, value, tags):
+        logger.log(self.level, f"{kind} {name}={value} {tags}")
+
+
+class StatsdSink:
+    """Sends metrics over UDP in StatsD format, tags in the DogStatsD extension"""
+
+    TYPES = {"timing": "ms", "counter": "c", "histogram": "h"}
+
+    def __init__(self, host="127.0.0.1", port=8125, prefix="slack_approval."):
+        self.address = (host, int(port))
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def record(self, kind, name, value, tags):
+        if kind == "timing":
+            value = round(value * 1000, 3)
+        line = f"{self.prefix}{name}:{value}|{self.TYPES[kind]}"
+        if tags:
+            line += "|#" + ",".join(f"{k}:{v}" for k, v in tags.items())
+        try:
+            self.socket.sendto(line.encode(), self.address)
+        except OSError as e:
+            logger.debug(e)
+
+
+def get_sink():
+    global _sink
+    if _sink is _UNSET:
+        kind = os.environ.get("SLACK_APPROVAL_METRICS")
+        if kind == "logging":
+            _sink = LoggingSink()
+        elif kind == "statsd":
+            _sink = StatsdSink(os.environ.get("STATSD_HOST", "127.0.0.1"), os.environ.get("STATSD_PORT", 8125))
+        else:
+            _sink = None
+    return _sink
+
+
+def set_sink(sink):
+    global _sink
+    _sink = sink
+
+
+def timing(name, seconds, **tags):
+    sink = get_sink()
+    if sink is not None:
+        sink.record("timing", name, seconds, tags)
+
+
+def increment(name, value=1, **tags):
+    sink = get_sink()
+    if sink is not None:
+        sink.record("counter", name, value, tags)
+
+
+def histogram(name, value, **tags):
+    sink = get_sink()
+    if sink is not None:
+        sink.record("histogram", name, value, tags)
+
+
+@contextmanager
+def timer(name, **tags):
+    if get_sink() is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing(name, time.perf_counter() - start, **tags)
+
+
+_profile_lock = threading.Lock()
+
+
+@contextmanager
+def profiled(name):
+    """Only one profile runs at a time, python 3.12+ refuses overlapping ones.
+    Overlapping calls, and calls while another profiler is active, run unprofiled"""
+    directory = os.environ.get("SLACK_APPROVAL_PROFILE_DIR")
+    if not directory or not _profile_lock.acquire(blocking=False):
+        yield
+        return
+    try:
+        import cProfile
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as e:
+            logger.warning(f"skipping profile of {name}: {e}")
+            profile = None
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+                try:
+                    os.makedirs(directory, exist_ok=True)
+                    profile.dump_stats(os.path.join(directory, f"{name}-{time.time():.6f}-{os.getpid()}.prof"))
+                except OSError as e:
+                    logger.error(e, exc_info=True)
+    finally:
+        _profile_lock.release()
+
+
+def instrumented(name, profile=False):
+    """Times every call of the decorated method, optionally under cProfile"""
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with profiled(name) if profile else _noop(), timer(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def _noop():
+    yield
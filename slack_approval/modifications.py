@@ -0,0 +1,134 @@
+"""Edit modal rendering and the diff of its submission against the request inputs.
+
+Lists are rendered one input per item. When that would exceed Slack's modal
+block limit, items are packed into multiline inputs instead, one item per line.
+"""
+# https://api.slack.com/reference/surfaces/views
+MAX_MODAL_BLOCKS = 100
+# plain_text_input initial_value limit
+MAX_INPUT_CHARS = 3000
+MAX_LINES_PER_INPUT = 100
+
+SINGLE_PREFIX = "block_id_"
+MULTIVALUE_PREFIX = "multivalue_block_id_"
+MULTILINE_PREFIX = "multiline_block_id_"
+EMPTY_VALUE = "no value"
+
+
+def get_input_block(block_id, action_id, label, value, multiline=False):
+    return {
+        "type": "input",
+        "block_id": block_id,
+        "label": {"type": "plain_text", "text": label},
+        "element": {
+            "type": "plain_text_input",
+            "action_id": action_id,
+            "placeholder": {
+                "type": "plain_text",
+                "text": "Insert value (empty to remove)",
+            },
+            "initial_value": value,
+            "multiline": multiline,
+        },
+        "optional": True,
+    }
+
+
+def chunk_values(values):
+    """Packs list items into lines of multiline inputs within Slack's text limit"""
+    chunk, size = [], 0
+    for value in values:
+        if chunk and (len(chunk) >= MAX_LINES_PER_INPUT or size + len(value) + 1 > MAX_INPUT_CHARS):
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(value)
+        size += len(value) + 1
+    if chunk:
+        yield chunk
+
+
+def get_modifiable_fields_blocks(modifiables_fields):
+    blocks = [
+        {"type": "section", "text": {"type": "mrkdwn", "text": "Modify fields (empty text to remove)"}}
+    ]
+    # header, plus an input and divider per field or list item
+    block_count = 1 + sum(
+        max(1, len(value)) + 1 if isinstance(value, list) else 2 for value in modifiables_fields.values()
+    )
+    chunked = block_count > MAX_MODAL_BLOCKS
+
+    for name, value in modifiables_fields.items():
+        if isinstance(value, list):
+            values = [v if v != "" and v is not None else EMPTY_VALUE for v in value] or [EMPTY_VALUE]
+            if chunked:
+                chunks = list(chunk_values([str(v) for v in values]))
+                for number, chunk in enumerate(chunks):
+                    blocks.append(get_input_block(
+                        f"{MULTILINE_PREFIX}{name}_{number}", f"action_id_{name}_{number}",
+                        f"{name} ({number + 1}/{len(chunks)}, one per line)", "\n".join(chunk), multiline=True,
+                    ))
+            else:
+                for number, valid_value in enumerate(values):
+                    blocks.append(get_input_block(
+                        f"{MULTIVALUE_PREFIX}{name}_{number}", f"action_id_{name}_{number}", name, valid_value,
+                    ))
+            blocks.append({"type": "divider"})
+            continue
+        valid_value = value if value != "" and value is not None else EMPTY_VALUE
+        blocks.append(get_input_block(f"{SINGLE_PREFIX}{name}", f"action_id_{name}", name, valid_value))
+        blocks.append({"type": "divider"})
+    return blocks
+
+
+def get_modifications(state_values, inputs):
+    """Applies the submitted edit modal state to inputs in a single pass.
+
+    Returns the change set, {field: {"old", "new", "added", "removed"}}, and
+    the modifications message for the threads (None without changes).
+    """
+    changes = {}
+    single_parts = []
+    old_lists = {}
+
+    for block_id, block_values in state_values.items():
+        if block_id.startswith(MULTIVALUE_PREFIX) or block_id.startswith(MULTILINE_PREFIX):
+            multiline = block_id.startswith(MULTILINE_PREFIX)
+            block_name = block_id[len(MULTILINE_PREFIX if multiline else MULTIVALUE_PREFIX):]
+            key = block_name.rpartition("_")[0]
+            if key not in old_lists:
+                old_lists[key] = inputs[key]
+                inputs[key] = []
+            action = block_values.get(f"action_id_{block_name}")
+            if action is None or not action["value"]:
+                continue
+            if multiline:
+                inputs[key].extend(line.strip() for line in action["value"].splitlines() if line.strip())
+            else:
+                inputs[key].append(action["value"])
+        elif block_id.startswith(SINGLE_PREFIX):
+            name = block_id[len(SINGLE_PREFIX):]
+            action = block_values.get(f"action_id_{name}")
+            if action is None:
+                continue
+            old_value, new_value = inputs[name], action["value"]
+            if old_value != new_value:
+                inputs[name] = new_value
+                changes[name] = {"old": old_value, "new": new_value, "added": [], "removed": []}
+                single_parts.append(f" {old_value} -> {new_value} \n")
+
+    list_parts = []
+    for key, old_value in old_lists.items():
+        new_value = inputs[key]
+        if new_value != old_value:
+            new_items, old_items = set(map(str, new_value)), set(map(str, old_value))
+            changes[key] = {
+                "old": old_value,
+                "new": new_value,
+                "added": [v for v in new_value if str(v) not in old_items],
+                "removed": [v for v in old_value if str(v) not in new_items],
+            }
+            list_parts.append(f" {key}:{old_value} -> {new_value} \n")
+
+    if not changes:
+        return changes, None
+    return changes, "Modifications: " + "".join(single_parts + list_parts)
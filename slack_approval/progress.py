@@ -0,0 +1,70 @@
+import logging
+import os
+import threading
+
+logger = logging.getLogger("slack_progress")
+logger.setLevel(logging.DEBUG)
+
+# Each update is a chat_update per message, chat.update allows about 50 per minute
+DEFAULT_INTERVAL = 3.0
+
+
+class ProgressReporter:
+    """Sends the latest progress event at most once per `interval` from a
+    background thread. Events reported in between are coalesced, only the
+    last one is sent. `close` is called from the thread before it exits."""
+
+    def __init__(self, send, interval=None, close=None):
+        self.send = send
+        self.close = close
+        self.interval = interval if interval is not None else float(
+            os.environ.get("PROGRESS_INTERVAL", DEFAULT_INTERVAL)
+        )
+        self.events = 0
+        self.updates = 0
+        self._latest = None
+        self._sent = None
+        self._stopped = False
+        self._thread = None
+        self._condition = threading.Condition()
+
+    def report(self, message):
+        with self._condition:
+            if self._stopped:
+                return
+            self._latest = message
+            self.events += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name="provision-progress")
+                self._thread.start()
+            self._condition.notify()
+
+    def stop(self):
+        """Drops pending events and waits for an update in flight, so nothing lands after the final status"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        try:
+            self._send_latest()
+        finally:
+            if self.close is not None:
+                self.close()
+
+    def _send_latest(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._stopped or self._latest != self._sent)
+                if self._stopped:
+                    return
+                message = self._sent = self._latest
+            try:
+                self.send(message)
+                self.updates += 1
+            except Exception as e:
+                logger.error(e, stack_info=True, exc_info=True)
+            with self._condition:
+                self._condition.wait_for(lambda: self._stopped, timeout=self.interval)
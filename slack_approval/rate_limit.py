@@ -0,0 +1,179 @@
+import inspect
+import json
+import logging
+import threading
+import time
+
+from slack_sdk import errors
+
+from slack_approval import metrics
+
+logger = logging.getLogger("slack_rate_limit")
+logger.setLevel(logging.DEBUG)
+
+# Calls per minute, per workspace. https://api.slack.com/docs/rate-limits
+METHOD_LIMITS = {
+    # Paced per channel by CHANNEL_LIMIT, this is only the workspace wide ceiling
+    "chat_postMessage": 600,
+    "chat_update": 50,
+    "users_lookupByEmail": 50,
+    "users_info": 100,
+    "views_open": 100,
+}
+DEFAULT_LIMIT = 20
+# Slack allows about one message per second per channel
+CHANNEL_LIMIT = 60
+CHANNEL_METHODS = ("chat_postMessage", "chat_update")
+
+
+class TokenBucket:
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60
+        self.capacity = capacity or max(1, per_minute // 6)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Takes a token and returns how long to wait before using it.
+        Tokens go negative to queue callers instead of dropping them"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+            return max(delay, self.blocked_until - now)
+
+    def block(self, seconds):
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class SlackScheduler:
+    """Paces Slack calls with a token bucket per method and per channel and
+    retries rate limited calls after Retry-After"""
+
+    def __init__(self, method_limits=None, channel_limit=CHANNEL_LIMIT, max_retries=3):
+        self.method_limits = dict(METHOD_LIMITS, **(method_limits or {}))
+        self.channel_limit = channel_limit
+        self.max_retries = max_retries
+        self.buckets = {}
+        self.calls = 0
+        self.retries = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._lock = threading.Lock()
+
+    def call(self, token, method, function, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            delay = self._reserve(token, method, kwargs.get("channel"))
+            if delay > 0:
+                time.sleep(delay)
+            self._done_waiting(delay, method, kwargs)
+            try:
+                with metrics.timer("slack.call", method=method):
+                    return function(**kwargs)
+            except errors.SlackApiError as e:
+                if not self._should_retry(token, method, e, attempt):
+                    raise
+
+    async def acall(self, token, method, function, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            delay = self._reserve(token, method, kwargs.get("channel"))
+            if delay > 0:
+                import asyncio
+
+                await asyncio.sleep(delay)
+            self._done_waiting(delay, method, kwargs)
+            try:
+                with metrics.timer("slack.call", method=method):
+                    return await function(**kwargs)
+            except errors.SlackApiError as e:
+                if not self._should_retry(token, method, e, attempt):
+                    raise
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "retries": self.retries,
+                "queue_depth": self.waiting,
+                "max_queue_depth": self.max_waiting,
+                "total_wait": self.total_wait,
+                "max_wait": self.max_wait,
+                "average_wait": self.total_wait / self.calls if self.calls else 0.0,
+            }
+
+    def _bucket(self, key, per_minute):
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                bucket = self.buckets.setdefault(key, TokenBucket(per_minute))
+        return bucket
+
+    def _reserve(self, token, method, channel):
+        delay = self._bucket((token, method), self.method_limits.get(method, DEFAULT_LIMIT)).reserve()
+        if channel and method in CHANNEL_METHODS:
+            delay = max(delay, self._bucket((token, channel), self.channel_limit).reserve())
+        with self._lock:
+            self.calls += 1
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+        return delay
+
+    def _done_waiting(self, delay, method, kwargs):
+        with self._lock:
+            self.waiting -= 1
+            self.total_wait += delay
+            self.max_wait = max(self.max_wait, delay)
+        if metrics.get_sink() is not None:
+            metrics.increment("slack.calls", method=method)
+            metrics.timing("slack.wait", delay, method=method)
+            metrics.histogram("slack.payload_bytes", len(json.dumps(kwargs, default=str)), method=method)
+
+    def _should_retry(self, token, method, error, attempt):
+        response = error.response
+        if getattr(response, "status_code", None) != 429 or attempt >= self.max_retries:
+            return False
+        headers = {k.lower(): v for k, v in (response.headers or {}).items()}
+        retry_after = float(headers.get("retry-after", 1))
+        logger.warning(f"{method} rate limited, retrying in {retry_after}s")
+        self._bucket((token, method), self.method_limits.get(method, DEFAULT_LIMIT)).block(retry_after)
+        with self._lock:
+            self.retries += 1
+        metrics.increment("slack.retries", method=method)
+        return True
+
+
+class ScheduledClient:
+    """Sends every API method of a WebClient through a SlackScheduler"""
+
+    def __init__(self, client, scheduler):
+        self.client = client
+        self.scheduler = scheduler
+
+    def __getattr__(self, name):
+        attribute = getattr(self.client, name)
+        if name.startswith("_") or not callable(attribute):
+            return attribute
+
+        def call(**kwargs):
+            return self.scheduler.call(self.client.token, name, attribute, **kwargs)
+
+        return call
+
+
+class AsyncScheduledClient(ScheduledClient):
+    def __getattr__(self, name):
+        attribute = getattr(self.client, name)
+        if name.startswith("_") or not inspect.iscoroutinefunction(attribute):
+            return attribute
+
+        async def call(**kwargs):
+            return await self.scheduler.acall(self.client.token, name, attribute, **kwargs)
+
+        return call
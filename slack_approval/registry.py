@@ -0,0 +1,55 @@
+import importlib
+import threading
+
+_classes = {}
+_lock = threading.Lock()
+
+
+class UnknownProvisionClass(KeyError):
+    pass
+
+
+def get_class_key(name):
+    # "Provision LB Endpoint" and "ProvisionLBEndpoint" map to the same class, rules, digest and renderer
+    return name.replace(" ", "")
+
+
+def register(cls=None, name=None):
+    """Registers a SlackProvision subclass, usable as a decorator:
+
+        @register
+        class ProvisionLBEndpoint(SlackProvision): ...
+    """
+
+    def wrap(cls):
+        _classes[get_class_key(name or cls.__name__)] = cls
+        return cls
+
+    return wrap(cls) if cls is not None else wrap
+
+
+def register_lazy(name, path):
+    """Registers a class by "module:Class" path, imported the first time it's requested"""
+    _classes[get_class_key(name)] = path
+
+
+def register_many(mapping):
+    for name, path in mapping.items():
+        register_lazy(name, path)
+
+
+def get_provision_class(name):
+    key = get_class_key(name)
+    target = _classes.get(key)
+    if target is None:
+        raise UnknownProvisionClass(
+            f"Unknown provision_class {name!r}, registered classes: {', '.join(sorted(_classes)) or 'none'}"
+        )
+    if isinstance(target, str):
+        with _lock:
+            target = _classes[key]
+            if isinstance(target, str):
+                module_name, _, class_name = target.partition(":")
+                target = getattr(importlib.import_module(module_name), class_name or key)
+                _classes[key] = target
+    return target
@@ -0,0 +1,82 @@
+"""Auto-approval rules, evaluated by the request function before any Slack call.
+
+A rules file is JSON, a list of rules or {"rules": [...]}:
+
+    {"rules": [{
+        "name": "dev services",
+        "provision_class": "Provision Service",
+        "requesters": ["jane@example.com"],
+        "match": {"environment": "dev", "size": ["small", "medium"]}
+    }]}
+
+A rule matches when every `match` field of the request has one of the given
+values (all items of a list field must), and the requester is listed, if
+`requesters` is given. Rules are indexed by provision_class and requester,
+so a request is only checked against the rules that could match it.
+"""
+import json
+import os
+import threading
+
+from slack_approval.registry import get_class_key
+
+
+class RuleSet:
+    def __init__(self, rules):
+        self.index = {}
+        for rule in rules:
+            conditions = tuple(
+                (field, frozenset(_text(v) for v in (allowed if isinstance(allowed, list) else [allowed])))
+                for field, allowed in rule.get("match", {}).items()
+            )
+            compiled = (rule.get("name") or rule["provision_class"], conditions)
+            for requester in rule.get("requesters") or [None]:
+                self.index.setdefault((get_class_key(rule["provision_class"]), requester), []).append(compiled)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            rules = json.load(f)
+        return cls(rules["rules"] if isinstance(rules, dict) else rules)
+
+    def __len__(self):
+        return sum(len(rules) for rules in self.index.values())
+
+    def match(self, name, inputs):
+        """Returns the name of the first rule that matches the request, None otherwise"""
+        key = get_class_key(name)
+        for candidates in (self.index.get((key, inputs.get("requester"))), self.index.get((key, None))):
+            for rule_name, conditions in candidates or ():
+                if all(field in inputs and _matches(inputs[field], allowed) for field, allowed in conditions):
+                    return rule_name
+        return None
+
+
+def _text(value):
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+def _matches(value, allowed):
+    if isinstance(value, list):
+        return all(_text(v) in allowed for v in value)
+    return _text(value) in allowed
+
+
+_default_rules = None
+_default_rules_lock = threading.Lock()
+
+
+def get_default_rules():
+    """Loaded once from the file at AUTO_APPROVAL_RULES, None if it's not set"""
+    global _default_rules
+    if _default_rules is None and os.environ.get("AUTO_APPROVAL_RULES"):
+        with _default_rules_lock:
+            if _default_rules is None:
+                _default_rules = RuleSet.from_file(os.environ["AUTO_APPROVAL_RULES"])
+    return _default_rules
+
+
+def set_default_rules(rules):
+    global _default_rules
+    with _default_rules_lock:
+        _default_rules = rules
@@ -0,0 +1,67 @@
+"""Request signature pre-check, run on the raw body before any payload parsing
+or Slack call so forged and stale requests cost next to nothing.
+https://api.slack.com/authentication/verifying-requests-from-slack
+"""
+import os
+import time
+from functools import lru_cache
+
+# Slack's recommendation, older requests are treated as replays
+MAX_AGE = 5 * 60
+
+
+@lru_cache(maxsize=32)
+def get_verifier(signing_secret):
+    from slack_sdk.signature import SignatureVerifier
+
+    return SignatureVerifier(signing_secret)
+
+
+def is_signed_request(headers, body, signing_secrets, max_age=MAX_AGE, now=None):
+    """Returns the one of `signing_secrets` the body is signed with, None if it
+    isn't or the signature timestamp is more than `max_age` seconds away.
+    With several workspaces, check the returned secret with `is_signed_for`
+    once the payload is parsed"""
+    timestamp = headers.get("x-slack-request-timestamp")
+    signature = headers.get("x-slack-signature")
+    if not timestamp or not signature:
+        return None
+    try:
+        age = abs((now or time.time()) - int(timestamp))
+    except ValueError:
+        return None
+    if age > max_age:
+        return None
+    if isinstance(signing_secrets, str):
+        signing_secrets = [signing_secrets]
+    for secret in signing_secrets:
+        if secret and get_verifier(secret).is_valid(body, timestamp, signature):
+            return secret
+    return None
+
+
+def get_workspace_signing_secret(workspace):
+    """The secret requests routed to `workspace` are signed with, SIGNING_SECRET for unrouted ones"""
+    if workspace is not None and workspace.signing_secret:
+        return workspace.signing_secret
+    return os.environ.get("SIGNING_SECRET")
+
+
+def is_signed_for(payload, signing_secret):
+    """True if `signing_secret`, the one the request was signed with, belongs to the
+    workspace the payload routes to. Otherwise anyone holding one workspace's secret
+    could act in another one with its token"""
+    from slack_approval.workspaces import route_payload
+
+    return signing_secret is not None and signing_secret == get_workspace_signing_secret(route_payload(payload))
+
+
+def get_signing_secrets():
+    """SIGNING_SECRET and the signing secrets of the routed workspaces, see slack_approval.workspaces"""
+    from slack_approval.workspaces import get_default_router
+
+    secrets = [os.environ.get("SIGNING_SECRET")]
+    router = get_default_router()
+    if router is not None:
+        secrets.extend(router.signing_secrets())
+    return [secret for secret in dict.fromkeys(secrets) if secret]
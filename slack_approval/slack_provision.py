@@ -1,19 +1,31 @@
+import copy
+import inspect
 import json
 import os
 import logging
-import re
-import asyncio
+import threading
 
-from slack_sdk.signature import SignatureVerifier
-from slack_sdk import WebhookClient, WebClient, errors
-from slack_sdk.web.async_client import AsyncWebClient
+from slack_sdk import errors
+
+from slack_approval.cache import get_default_user_cache
+from slack_approval.clients import get_default_pool
+from slack_approval.deferred import DEFERRED_ACTIONS, get_worker_pool
+from slack_approval.digest import get_default_digest_buffer, get_row_status
+from slack_approval.idempotency import get_default_guard, get_idempotency_key
+from slack_approval.metrics import increment, instrumented, timer
+from slack_approval.progress import ProgressReporter
+from slack_approval.modifications import get_modifiable_fields_blocks, get_modifications
+from slack_approval.signature import get_workspace_signing_secret, is_signed_request
+from slack_approval.state import dump_state, get_default_state_store, load_state
+
+from slack_approval.workspaces import route_payload
 
 from slack_approval.utils import (
     get_header_block,
-    get_inputs_blocks,
     get_status_block,
     get_exception_block,
     get_buttons_blocks,
+    render_inputs,
 )
 
 logger = logging.getLogger("slack_provision")
@@ -21,18 +33,42 @@ logger.setLevel(logging.DEBUG)
 
 
 class SlackProvision:
-    def __init__(self, request):
+    # Update the approvers message through the interaction's response_url instead of chat.update,
+    # None follows UPDATE_VIA_RESPONSE_URL
+    update_via_response_url = None
+
+    @instrumented("provision.init")
+    def __init__(self, request, client_pool=None, user_cache=None, state_store=None, idempotency_guard=None):
+        self.data = request.get_data()
+        self.headers = request.headers
+        self.payload = json.loads(request.form["payload"])
+        self.workspace = route_payload(self.payload)
+        if self.workspace is not None:
+            self.client_pool = client_pool or self.workspace.client_pool
+            self.user_cache = user_cache or self.workspace.user_cache
+        else:
+            self.client_pool = client_pool or get_default_pool()
+            self.user_cache = user_cache or get_default_user_cache()
+        self.state_store = state_store or get_default_state_store()
+        self.idempotency_guard = idempotency_guard or get_default_guard()
+        self.digest_buffer = get_default_digest_buffer()
+        self.digest_row = None
+        self.progress_reporter = None
+        self.response_url = None
+        self.idempotency_key = None
+        self.duplicate_of = None
         self.exception = None
+        # The watchdog of run_deferred may report a timeout while the action still runs
+        self.status_lock = threading.Lock()
+        self.final_status_sent = threading.Event()
         self.channel_id = None
         self.reason = None
         self.user_payload = None
         self.user = None
         self.user_id = None
         self.modifications_message = None
-        self.token = os.environ.get("SLACK_BOT_TOKEN")
-        self.data = request.get_data()
-        self.headers = request.headers
-        self.payload = json.loads(request.form["payload"])
+        self.changes = {}
+        self.token = self.workspace.token if self.workspace is not None else os.environ.get("SLACK_BOT_TOKEN")
         # Comes from the reject response modal view (data comes in private metadata)
         if self.is_callback_view(callback_id="reject_reason_modal"):
             self.action_id = "Reject Response"
@@ -40,15 +76,17 @@ class SlackProvision:
             self.reason = self.payload["view"]["state"]["values"]["reason_block"][
                 "reject_reason_input"
             ]["value"]
+            self.claim_interaction()
             return
         elif self.is_callback_view(callback_id="edit_view_modal"):
             self.action_id = "Modified"
             self.get_private_metadata()
             self.get_modifications()
+            self.claim_interaction()
             return
 
         self.action = self.payload["actions"][0]
-        self.inputs = json.loads(self.action["value"])
+        self.inputs = load_state(self.action["value"], self.state_store)
         self.response_url = self.payload["response_url"]
         self.action_id = self.action["action_id"]
         self.get_user_info()
@@ -58,6 +96,7 @@ class SlackProvision:
         self.approvers_ts = self.payload["container"]["message_ts"]
         self.requesters_channel = self.inputs.pop("requesters_channel")
         self.approvers_channel = self.inputs.pop("approvers_channel")
+        self.digest_row = self.inputs.pop("digest_row", None)
         if "requester_info" in self.inputs:
             self.requester_info = json.loads(self.inputs.pop("requester_info"))
 
@@ -66,15 +105,94 @@ class SlackProvision:
         """ Requester can response depending on flag for prevent self approval and user-requester values
             Backward compatibility: prevent_self_approval deactivated """
         self.prevent_self_approval = self.inputs.pop("prevent_self_approval", False)
-        if not self.is_allowed():
+        if not self.claim_interaction():
+            return
+        try:
+            allowed = self.is_allowed()
+        except Exception:
+            self.release_interaction()
+            raise
+        if not allowed:
+            # Leave the action to an approver that is allowed
+            self.release_interaction()
             self.action_id = "Not allowed"
 
+    @classmethod
+    def from_inputs(cls, inputs, user, client_pool=None, user_cache=None, state_store=None, token=None):
+        """Builds a provision for a request nobody clicked on, ie. an auto-approved one.
+        `inputs` are the request's button value, approved() sees the same self.inputs"""
+        provision = cls.__new__(cls)
+        provision.client_pool = client_pool or get_default_pool()
+        provision.user_cache = user_cache or get_default_user_cache()
+        provision.state_store = state_store or get_default_state_store()
+        provision.token = token or os.environ.get("SLACK_BOT_TOKEN")
+        provision.workspace = None
+        provision.exception = None
+        provision.status_lock = threading.Lock()
+        provision.final_status_sent = threading.Event()
+        provision.changes = {}
+        provision.user = user
+        provision.user_payload = None
+        provision.user_id = None
+        provision.action_id = "Approved"
+        provision.digest_row = None
+        provision.progress_reporter = None
+        provision.response_url = None
+        provision.inputs = dict(inputs)
+        provision.name = provision.inputs["provision_class"]
+        provision.requesters_ts = provision.inputs.pop("requesters_ts", None)
+        provision.requesters_channel = provision.inputs.pop("requesters_channel", None)
+        provision.approvers_channel = provision.inputs.pop("approvers_channel", None)
+        provision.approvers_ts = None
+        provision.requester_info = json.loads(provision.inputs.pop("requester_info", "null"))
+        provision.requester = provision.inputs.get("requester", "")
+        provision.modifiables_fields = provision.get_modifiable_fields()
+        provision.prevent_self_approval = provision.inputs.pop("prevent_self_approval", False)
+        return provision
+
+    @instrumented("provision.call", profile=True)
     def __call__(self):
+        if self.action_id == "Duplicate":
+            return
+        action_id = self.action_id
+        try:
+            self.handle_action()
+        finally:
+            if self.idempotency_key is not None:
+                self.idempotency_guard.complete(self.idempotency_key, {
+                    "action": action_id,
+                    "exception": str(self.exception) if self.exception else None,
+                })
+
+    def claim_interaction(self):
+        """Marks the action as a duplicate if this interaction was already handled,
+        ie. a Slack retry or a concurrent delivery"""
+        # Rows of a digest share its message
+        message_id = self.approvers_ts if self.digest_row is None else f"{self.approvers_ts}:{self.digest_row}"
+        key = get_idempotency_key(message_id, self.action_id, self.payload)
+        self.duplicate_of = self.idempotency_guard.claim(key)
+        if self.duplicate_of is not None:
+            logger.info(f"skipping duplicate delivery of {key}: {self.duplicate_of}")
+            self.action_id = "Duplicate"
+            return False
+        # Completed by __call__, anything failing before it must call release_interaction
+        self.idempotency_key = key
+        return True
+
+    def release_interaction(self):
+        """Gives up the claim so a retry or another delivery can handle the interaction"""
+        if self.idempotency_key is not None:
+            self.idempotency_guard.release(self.idempotency_key)
+            self.idempotency_key = None
+
+    def handle_action(self):
         mention_requester = True
+        thread_message = None
         try:
             if self.action_id == "Approved":
                 mention_requester = True
-                self.approved()
+                with timer("provision.approved", provision_class=self.name):
+                    self.call_hook(self.approved)
             elif self.action_id == "Rejected":
                 self.open_reject_reason_view()
                 return
@@ -83,44 +201,130 @@ class SlackProvision:
                 self.open_message_dialog(title="Warning", message=message)
                 return
             elif self.action_id == "Reject Response":
-                self.rejected()
-                message = f"reason for rejection: {self.reason}"
-                asyncio.run(self.send_message_to_thread(message=message,
-                                            thread_ts=self.requesters_ts,
-                                            channel=self.requesters_channel,
-                                            mention_requester=mention_requester))
-
-                asyncio.run(self.send_message_to_thread(message=message,
-                                            thread_ts=self.approvers_ts,
-                                            channel=self.channel_id,
-                                            mention_requester=mention_requester))
+                with timer("provision.rejected", provision_class=self.name):
+                    self.call_hook(self.rejected)
+                thread_message = f"reason for rejection: {self.reason}"
             elif self.action_id == "Edit":
                 self.open_edit_view()
                 return
             elif self.action_id == "Modified":
-                self.send_modified_message()
-                if self.modifications_message is not None:
-                    asyncio.run(self.send_message_to_thread(message=self.modifications_message,
-                                                            thread_ts=self.requesters_ts,
-                                                            channel=self.requesters_channel,
-                                                            mention_requester=mention_requester))
-
-                    asyncio.run(self.send_message_to_thread(message=self.modifications_message,
-                                                            thread_ts=self.approvers_ts,
-                                                            channel=self.channel_id,
-                                                            mention_requester=mention_requester))
+                self.send_modified_message(thread_message=self.modifications_message,
+                                           mention_requester=mention_requester)
                 return
         except Exception as e:
             self.exception = e
             logger.error(e, stack_info=True, exc_info=True)
-        self.send_status_message(status=self.action_id, mention_requester=mention_requester)
+        with self.status_lock:
+            self.send_status_message(status=self.action_id, mention_requester=mention_requester,
+                                     thread_message=thread_message)
+            self.final_status_sent.set()
+
+    def call_hook(self, hook):
+        """Runs approved() or rejected(), a generator hook reports every value it yields as progress"""
+        try:
+            result = hook()
+            if inspect.isgenerator(result):
+                for event in result:
+                    self.report_progress(event)
+        finally:
+            self.stop_progress()
+
+    async def run_hook(self, hook):
+        """Awaits async hooks on the running loop, sync ones run in a thread pool"""
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        if not (inspect.iscoroutinefunction(hook) or inspect.isasyncgenfunction(hook)):
+            return await loop.run_in_executor(None, self.call_hook, hook)
+        try:
+            if inspect.isasyncgenfunction(hook):
+                async for event in hook():
+                    self.report_progress(event)
+            else:
+                await hook()
+        finally:
+            await loop.run_in_executor(None, self.stop_progress)
+
+    def report_progress(self, message):
+        """Shows `message` on both messages while approved() or rejected() runs.
+        Updates are coalesced and sent at most every PROGRESS_INTERVAL seconds"""
+        if self.approvers_ts is None:
+            # Nothing posted to update, ie. an auto-approved request
+            logger.info(message)
+            return
+        if self.progress_reporter is None:
+            # The reporter's thread is short lived, its loop and sessions are closed when it stops
+            self.progress_reporter = ProgressReporter(self.send_progress, close=self.client_pool.close_thread)
+        self.progress_reporter.report(message)
+
+    def stop_progress(self):
+        if self.progress_reporter is not None:
+            self.progress_reporter.stop()
+
+    def send_progress(self, message):
+        hide = self.inputs.get("hide") or []
+        inputs = {key: value for key, value in self.inputs.items() if key not in hide and key != "hide"}
+        status = f"{self.action_id}, in progress"
+        blocks = []
+        blocks.extend(get_header_block(name=self.name))
+        blocks.extend(render_inputs(self.name, inputs))
+        blocks.extend(get_status_block(status=status, user=self.user))
+        blocks.append({"type": "context", "elements": [{"type": "mrkdwn", "text": str(message)}]})
+        digest = None
+        if self.digest_row is not None:
+            digest = self.digest_buffer.set_row_status(
+                self.approvers_channel, self.approvers_ts, self.digest_row,
+                get_row_status(f"{status}: {message}", self.user),
+            )
+        self.client_pool.run(self.update_progress(blocks, digest))
+
+    async def update_progress(self, blocks, digest=None):
+        """Progress updates are best effort, a failed one doesn't mark the action as failed"""
+        client = self.client_pool.get_async_client(self.token)
+
+        async def update(channel, ts, blocks):
+            try:
+                await client.chat_update(channel=channel, ts=ts, blocks=blocks, text="fallback")
+            except errors.SlackApiError as e:
+                logger.error(e, stack_info=True, exc_info=True)
 
-    def is_valid_signature(self, signing_secret):
-        """Validates the request from the Slack integration"""
-        timestamp = self.headers["x-slack-request-timestamp"]
-        signature = self.headers["x-slack-signature"]
-        verifier = SignatureVerifier(signing_secret)
-        return verifier.is_valid(self.data, timestamp, signature)
+        await update(self.requesters_channel, self.requesters_ts, blocks)
+        if digest is None:
+            await update(self.approvers_channel, self.approvers_ts, blocks)
+            return
+        await self.digest_buffer.send_digest(self.approvers_channel, self.approvers_ts, digest,
+                                             lambda blocks: update(self.approvers_channel, self.approvers_ts, blocks))
+
+    def is_deferrable(self):
+        """Actions that run user code can be acked first and run later"""
+        return self.action_id in DEFERRED_ACTIONS
+
+    def run_deferred(self, timeout=None):
+        """Runs the action under a watchdog so the status is updated even if it hangs"""
+        from concurrent import futures
+
+        try:
+            get_worker_pool().submit(self).result(timeout)
+        except futures.TimeoutError:
+            exception = TimeoutError(f"{self.action_id} did not finish within {timeout} seconds")
+            logger.error(exception)
+            with self.status_lock:
+                if self.final_status_sent.is_set():
+                    # Finished in the meantime, its status is already up
+                    return
+                # The action still runs on self, the timeout is reported from a copy that doesn't share its
+                # exception or inputs. A late finish rewrites the status with its outcome
+                watchdog = copy.copy(self)
+                watchdog.inputs = dict(self.inputs)
+                watchdog.exception = exception
+                watchdog.send_status_message(status=self.action_id, mention_requester=True)
+
+    def get_signing_secret(self):
+        return get_workspace_signing_secret(self.workspace)
+
+    def is_valid_signature(self, signing_secret=None):
+        """Validates the request from the Slack integration, with its workspace's secret by default"""
+        return is_signed_request(self.headers, self.data, signing_secret or self.get_signing_secret()) is not None
 
     @staticmethod
     def approved():
@@ -139,24 +343,61 @@ class SlackProvision:
                     self.inputs.pop(field, None)
                 self.inputs.pop("hide")
 
-            # Message to requester
-            slack_web_client = AsyncWebClient(self.token)
-            response = await slack_web_client.chat_update(
-                channel=self.approvers_channel,
-                ts=self.approvers_ts,
-                blocks=blocks,
-                as_user=True,
-                text="fallback",
-            )
+            if self.digest_row is not None:
+                # Only the row of this request changes, the other rows keep their buttons
+                digest = self.digest_buffer.set_row_status(self.approvers_channel, self.approvers_ts, self.digest_row,
+                                                           get_row_status(self.action_id, self.user, self.exception))
+                await self.digest_buffer.send_digest(self.approvers_channel, self.approvers_ts, digest,
+                                                     self.update_approvers_message)
+                return
+
+            await self.update_approvers_message(blocks)
 
         except errors.SlackApiError as e:
             self.exception = e
             logger.error(e, stack_info=True, exc_info=True)
 
+    async def update_approvers_message(self, blocks):
+        if self.uses_response_url() and await self.send_response_url(blocks):
+            return
+
+        slack_web_client = self.client_pool.get_async_client(self.token)
+        await slack_web_client.chat_update(
+            channel=self.approvers_channel,
+            ts=self.approvers_ts,
+            blocks=blocks,
+            as_user=True,
+            text="fallback",
+        )
+
+    def uses_response_url(self):
+        if self.response_url is None:
+            return False
+        if self.update_via_response_url is not None:
+            return self.update_via_response_url
+        return os.environ.get("UPDATE_VIA_RESPONSE_URL", "").lower() in ("1", "true", "yes")
+
+    async def send_response_url(self, blocks):
+        """Replaces the approvers message through the response_url, which doesn't count
+        against chat.update's rate limit. False if the url expired or is used up"""
+        try:
+            webhook = self.client_pool.get_webhook_client(self.response_url)
+            response = await webhook.send(blocks=blocks, text="fallback", replace_original=True)
+        except Exception as e:
+            logger.warning(f"response_url update failed, falling back to chat.update: {e}")
+            increment("provision.response_url", outcome="error")
+            return False
+        if response.status_code != 200:
+            logger.info(f"response_url answered {response.status_code} {response.body}, falling back to chat.update")
+            increment("provision.response_url", outcome="expired")
+            return False
+        increment("provision.response_url", outcome="sent")
+        return True
+
     async def send_message_requester(self, blocks):
         try:
             # Message to requester
-            slack_web_client = AsyncWebClient(self.token)
+            slack_web_client = self.client_pool.get_async_client(self.token)
             response = await slack_web_client.chat_update(
                 channel=self.requesters_channel,
                 ts=self.requesters_ts,
@@ -167,16 +408,18 @@ class SlackProvision:
             self.exception = e
             logger.error(e, stack_info=True, exc_info=True)
 
-    def send_status_message(self, status, mention_requester=False):
+    def send_status_message(self, status, mention_requester=False, thread_message=None):
+        self.dispatch(*self.get_status_coroutines(status, mention_requester, thread_message))
+
+    def get_status_coroutines(self, status, mention_requester=False, thread_message=None):
         hide = self.inputs.get("hide")
         if hide:
             for field in hide:
                 self.inputs.pop(field, None)
             self.inputs.pop("hide")
         blocks = self.get_message_status(status, mention_requester)
-        # asyncio.run(self.send_message_approver(blocks))
-        # asyncio.run(self.send_message_requester(blocks))
-        self.send_message_requester_approver(blocks, blocks)
+        return self.get_message_coroutines(blocks, blocks, thread_message=thread_message,
+                                           mention_requester=mention_requester)
 
     async def send_message_to_thread(self, message, thread_ts, channel, mention_requester=False):
 
@@ -190,7 +433,7 @@ class SlackProvision:
 
             if mention_requester and requester_info:
                 message = f"<@{requester_info}> {message}"
-            client = AsyncWebClient(self.token)
+            client = self.client_pool.get_async_client(self.token)
             response = await client.chat_postMessage(
                 channel=channel,
                 thread_ts=thread_ts,
@@ -200,7 +443,10 @@ class SlackProvision:
             self.exception = e
             logger.error(e, stack_info=True, exc_info=True)
 
-    def send_modified_message(self):
+    def send_modified_message(self, thread_message=None, mention_requester=False):
+        self.dispatch(*self.get_modified_coroutines(thread_message, mention_requester))
+
+    def get_modified_coroutines(self, thread_message=None, mention_requester=False):
         hide = self.inputs.get("hide")
         if hide:
             for field in hide:
@@ -212,13 +458,13 @@ class SlackProvision:
         inputs.pop("modifiables_fields", None)
         requesters_blocks = []
         requesters_blocks.extend(get_header_block(name=self.name))
-        requesters_blocks.extend(get_inputs_blocks(self.inputs))
+        requesters_blocks.extend(render_inputs(self.name, self.inputs))
         requesters_blocks.extend(get_status_block(status="Pending. Modified ", user=self.user))
 
 
         approvers_blocks = []
         approvers_blocks.extend(get_header_block(name=self.name))
-        approvers_blocks.extend(get_inputs_blocks(self.inputs))
+        approvers_blocks.extend(render_inputs(self.name, self.inputs))
 
         values = self.inputs.copy()
         values["requesters_ts"] = self.requesters_ts
@@ -228,16 +474,19 @@ class SlackProvision:
         values["prevent_self_approval"] = self.prevent_self_approval
         values["modifiables_fields"] = ";".join(list(self.modifiables_fields.keys()))
         edit_button = values.get("modifiables_fields", None) is not None and values["modifiables_fields"] != ""
-        approvers_blocks.extend(get_buttons_blocks(value=json.dumps(values), edit_button=edit_button))
-        self.send_message_requester_approver(requesters_blocks, approvers_blocks)
+        approvers_blocks.extend(get_buttons_blocks(value=dump_state(values, self.state_store), edit_button=edit_button))
+        return self.get_message_coroutines(requesters_blocks, approvers_blocks,
+                                           thread_message=thread_message,
+                                           mention_requester=mention_requester)
 
     def is_allowed(self):
         if not self.prevent_self_approval:
             return True
         try:
-            slack_web_client = WebClient(self.token)
-            user_info = slack_web_client.users_info(user=self.user_payload["id"])
-            user_email = user_info["user"]["profile"]["email"]
+            user_email = self.user_cache.get_email(self.user_payload["id"])
+            if user_email is None:
+                user_email = self.client_pool.run(self.lookup_email(self.user_payload["id"]))
+                self.user_cache.set_user(self.user_payload["id"], user_email)
             if user_email == self.requester and self.action_id == "Approved":
                 return False
             else:
@@ -246,6 +495,11 @@ class SlackProvision:
             self.exception = e
             logger.error(e, stack_info=True, exc_info=True)
 
+    async def lookup_email(self, user_id):
+        slack_web_client = self.client_pool.get_async_client(self.token)
+        user_info = await slack_web_client.users_info(user=user_id)
+        return user_info["user"]["profile"]["email"]
+
     def is_callback_view(self, callback_id):
         return (
                 self.payload.get("type", "") == "view_submission"
@@ -261,7 +515,7 @@ class SlackProvision:
         self.user_id = self.user_payload["id"]
 
     def get_private_metadata(self):
-        metadata = json.loads(self.payload["view"]["private_metadata"])
+        metadata = load_state(self.payload["view"]["private_metadata"], self.state_store)
         self.channel_id = metadata["channel_id"]
         self.requesters_ts = metadata["requesters_ts"]
         self.approvers_ts = metadata["approvers_ts"]
@@ -270,7 +524,6 @@ class SlackProvision:
         self.response_url = metadata["response_url"]
         self.requesters_channel = metadata["requesters_channel"]
         self.approvers_channel = metadata["approvers_channel"]
-        self.token = metadata["token"]
         self.exception = None
         self.requester = metadata["requester"]
         self.prevent_self_approval = metadata["prevent_self_approval"]
@@ -280,11 +533,12 @@ class SlackProvision:
         self.user_payload = metadata["user_payload"]
         self.user_id = metadata["user_id"]
         self.requester_info = metadata["requester_info"]
+        self.digest_row = metadata.get("digest_row")
 
     def get_message_status(self, status, mention_requester=False):
         blocks = []
         blocks.extend(get_header_block(name=self.name))
-        blocks.extend(get_inputs_blocks(self.inputs))
+        blocks.extend(render_inputs(self.name, self.inputs))
         if getattr(self, "requester_info", None) is None or "id" not in \
                 self.requester_info:
             mention_requester = False
@@ -299,137 +553,61 @@ class SlackProvision:
 
         return blocks
 
-    def open_message_dialog(self, title, message):
+    async def open_view(self, view):
+        """Opens a modal through the pooled keep-alive client"""
         try:
-            client = WebClient(self.token)
-            client.views_open(
-                trigger_id=self.payload["trigger_id"],
-                view={
-                    "type": "modal",
-                    "title": {"type": "plain_text", "text": title},
-                    "close": {"type": "plain_text", "text": "Close"},
-                    "blocks": [
-                        {
-                            "type": "section",
-                            "text": {
-                                "type": "mrkdwn",
-                                "text": message,
-                            },
-                        },
-                    ],
-                },
-            )
+            slack_web_client = self.client_pool.get_async_client(self.token)
+            await slack_web_client.views_open(trigger_id=self.payload["trigger_id"], view=view)
         except errors.SlackApiError as e:
+            self.exception = e
             logger.error(e, stack_info=True, exc_info=True)
 
+    def open_message_dialog(self, title, message):
+        self.client_pool.run(self.open_view(self.get_message_dialog_view(title, message)))
+
     def open_reject_reason_view(self):
-        private_metadata = self.construct_private_metadata()
-        try:
-            client = WebClient(self.token)
-            client.views_open(
-                trigger_id=self.payload["trigger_id"],
-                view=self.construct_reason_modal(
-                    private_metadata=json.dumps(private_metadata)
-                ),
-            )
-        except errors.SlackApiError as e:
-            self.exception = e
-            logger.error(e, stack_info=True, exc_info=True)
+        self.client_pool.run(self.open_view(self.get_reject_reason_view()))
 
     def open_edit_view(self):
+        self.client_pool.run(self.open_view(self.get_edit_view()))
+
+    @staticmethod
+    def get_message_dialog_view(title, message):
+        return {
+            "type": "modal",
+            "title": {"type": "plain_text", "text": title},
+            "close": {"type": "plain_text", "text": "Close"},
+            "blocks": [
+                {
+                    "type": "section",
+                    "text": {
+                        "type": "mrkdwn",
+                        "text": message,
+                    },
+                },
+            ],
+        }
+
+    def get_reject_reason_view(self):
+        private_metadata = self.construct_private_metadata()
+        return self.construct_reason_modal(private_metadata=dump_state(private_metadata, self.state_store))
+
+    def get_edit_view(self):
         self.inputs["modifiables_fields"] = ";".join(
             list(self.modifiables_fields.keys())
         )
         private_metadata = self.construct_private_metadata()
-
-        try:
-            modal_view = {
-                "type": "modal",
-                "callback_id": "edit_view_modal",
-                "private_metadata": json.dumps(private_metadata),
-                "title": {"type": "plain_text", "text": "Edit view"},
-                "blocks": self.construct_modifiable_fields_blocks(),
-                "submit": {"type": "plain_text", "text": "Save"},
-            }
-            client = WebClient(self.token)
-            client.views_open(trigger_id=self.payload["trigger_id"], view=modal_view)
-        except errors.SlackApiError as e:
-            self.exception = e
-            logger.error(e, stack_info=True, exc_info=True)
+        return {
+            "type": "modal",
+            "callback_id": "edit_view_modal",
+            "private_metadata": dump_state(private_metadata, self.state_store),
+            "title": {"type": "plain_text", "text": "Edit view"},
+            "blocks": self.construct_modifiable_fields_blocks(),
+            "submit": {"type": "plain_text", "text": "Save"},
+        }
 
     def construct_modifiable_fields_blocks(self):
-        blocks = [
-            {"type": "section", "text": {"type": "mrkdwn", "text": "Modify fields (empty text to remove)"}}
-        ]
-        for (
-                modifiable_field_name,
-                modifiable_field_value,
-        ) in self.modifiables_fields.items():
-            if isinstance(modifiable_field_value, list):
-                item_number = 0
-                if len(modifiable_field_value) == 0:
-                    field = {
-                        "type": "input",
-                        "block_id": f"multivalue_block_id_{modifiable_field_name}_{item_number}",
-                        "label": {"type": "plain_text", "text": modifiable_field_name},
-                        "element": {
-                            "type": "plain_text_input",
-                            "action_id": f"action_id_{modifiable_field_name}_{item_number}",
-                            "placeholder": {
-                                "type": "plain_text",
-                                "text": "Insert value (empty to remove)",
-                            },
-                            "initial_value": "no value",
-                            "multiline": False,
-                        },
-                        "optional": True,
-                    }
-                    blocks.append(field)
-                    blocks.append({"type": "divider"})
-                    continue
-                for valid_value in modifiable_field_value:
-                    valid_value = valid_value if valid_value != "" and valid_value is not None else "no value"
-                    field = {
-                        "type": "input",
-                        "block_id": f"multivalue_block_id_{modifiable_field_name}_{item_number}",
-                        "label": {"type": "plain_text", "text": modifiable_field_name},
-                        "element": {
-                            "type": "plain_text_input",
-                            "action_id": f"action_id_{modifiable_field_name}_{item_number}",
-                            "placeholder": {
-                                "type": "plain_text",
-                                "text": "Insert value (empty to remove)",
-                            },
-                            "initial_value": valid_value,
-                            "multiline": False,
-                        },
-                        "optional": True,
-                    }
-                    blocks.append(field)
-                    item_number += 1
-                blocks.append({"type": "divider"})
-                continue
-            valid_value = modifiable_field_value if modifiable_field_value != "" and modifiable_field_value is not None else "no value"
-
-            field = {
-                "type": "input",
-                "block_id": f"block_id_{modifiable_field_name}",
-                "label": {"type": "plain_text", "text": modifiable_field_name},
-                "element": {
-                    "type": "plain_text_input",
-                    "action_id": f"action_id_{modifiable_field_name}",
-                    "placeholder": {
-                        "type": "plain_text",
-                        "text": "Insert value (empty to remove)",
-                    },
-                    "initial_value": valid_value,
-                    "multiline": False,
-                },
-                "optional": True,
-            }
-            blocks.append(field)
-            blocks.append({"type": "divider"})
-        return blocks
+        return get_modifiable_fields_blocks(self.modifiables_fields)
 
     def get_modifiable_fields(self):
         modifiables_fields_names = self.inputs.pop("modifiables_fields", "")
@@ -441,58 +619,9 @@ class SlackProvision:
         return modifiables_fields
 
     def get_modifications(self):
-        available_blocks = self.payload["view"]["state"]["values"]
-        blocks = {
-            block_name.replace("block_id_", ""): block_values
-            for block_name, block_values in available_blocks.items()
-            if "block_id_" in block_name and not "multivalue_block_id_" in block_name
-        }
-        blocks = {
-            block_name: block_values
-            for block_name, block_values in blocks.items()
-            if f"action_id_{block_name}" in block_values
-        }
-
-        for block_name, block_values in blocks.items():
-            actual_value = self.inputs[block_name]
-            new_value = block_values[f"action_id_{block_name}"]["value"]
-            if actual_value != new_value:
-                if self.modifications_message is None:
-                    self.modifications_message = "Modifications: "
-                self.inputs[block_name] = new_value
-                self.modifications_message = f"{self.modifications_message} {actual_value} -> {new_value} \n"
-
-        blocks = {
-            block_name.replace("multivalue_block_id_", ""): block_values
-            for block_name, block_values in available_blocks.items()
-            if "multivalue_block_id_" in block_name
-        }
-
-        old_values = {}
-        for block_name, block_values in blocks.items():
-            key = re.sub(r"_\d+$", '', block_name)
-            if key not in old_values:
-                old_values[key] = self.inputs[key].copy()
-                self.inputs[re.sub(r"_\d+$", '', block_name)] = []
-
-        blocks = {
-            block_name: block_values
-            for block_name, block_values in blocks.items()
-            if f"action_id_{block_name}" in block_values
-        }
-
-        for block_name, block_values in blocks.items():
-            new_value = block_values[f"action_id_{block_name}"]["value"]
-            if new_value is None or new_value == "":
-                continue
-            self.inputs[re.sub(r"_\d+$", '', block_name)].append(new_value)
-
-        for block_name, block_values in old_values.items():
-            new_value = self.inputs[block_name]
-            if new_value != block_values:
-                if self.modifications_message is None:
-                    self.modifications_message = "Modifications: "
-                self.modifications_message = f"{self.modifications_message} {block_name}:{block_values} -> {new_value} \n"
+        self.changes, self.modifications_message = get_modifications(
+            self.payload["view"]["state"]["values"], self.inputs
+        )
 
     @staticmethod
     def construct_reason_modal(private_metadata):
@@ -529,16 +658,104 @@ class SlackProvision:
             "user_id": self.user_id,
             "response_url": self.response_url,
             "requesters_channel": self.requesters_channel,
-            "token": self.token,
             "requesters_ts": self.requesters_ts,
             "approvers_channel": self.approvers_channel,
             "requester": self.requester,
             "prevent_self_approval": self.prevent_self_approval,
             "modifiables_fields": self.modifiables_fields,
-            "requester_info": self.requester_info
+            "requester_info": self.requester_info,
+            "digest_row": self.digest_row,
         }
 
 
-    def send_message_requester_approver(self, requesters_blocks, approvers_blocks):
-        asyncio.run(self.send_message_requester(requesters_blocks))
-        asyncio.run(self.send_message_approver(approvers_blocks))
+    def send_message_requester_approver(self, requesters_blocks, approvers_blocks,
+                                        thread_message=None, mention_requester=False):
+        """Updates both messages and, if given, replies in both threads"""
+        self.dispatch(*self.get_message_coroutines(requesters_blocks, approvers_blocks,
+                                                   thread_message, mention_requester))
+
+    def get_message_coroutines(self, requesters_blocks, approvers_blocks,
+                               thread_message=None, mention_requester=False):
+        coroutines = [
+            self.send_message_requester(requesters_blocks),
+            self.send_message_approver(approvers_blocks),
+        ]
+        if thread_message is not None:
+            coroutines.extend(self.get_thread_coroutines(thread_message, mention_requester))
+        return coroutines
+
+    def get_thread_coroutines(self, message, mention_requester=False):
+        return [
+            self.send_message_to_thread(message=message,
+                                        thread_ts=self.requesters_ts,
+                                        channel=self.requesters_channel,
+                                        mention_requester=mention_requester),
+            self.send_message_to_thread(message=message,
+                                        thread_ts=self.approvers_ts,
+                                        channel=self.channel_id,
+                                        mention_requester=mention_requester),
+        ]
+
+    def dispatch(self, *coroutines):
+        """Runs the Slack calls of an action concurrently on a single loop"""
+        self.client_pool.run(self.gather_calls(*coroutines))
+
+    async def gather_calls(self, *coroutines):
+        """A failing call is recorded in self.exception without cancelling the others"""
+        import asyncio
+
+        for result in await asyncio.gather(*coroutines, return_exceptions=True):
+            if isinstance(result, Exception):
+                self.exception = result
+                logger.error(result, exc_info=result)
+
+
+class AsyncSlackProvision(SlackProvision):
+    """SlackProvision handled on a single event loop, for `async def approved()`
+    and `async def rejected()`. The user's rejected() runs alongside the thread
+    replies. Sync approved()/rejected() still work, they run in a thread pool."""
+
+    def handle_action(self):
+        self.client_pool.run(self.handle())
+
+    async def handle(self):
+        mention_requester = True
+        try:
+            if self.action_id == "Approved":
+                with timer("provision.approved", provision_class=self.name):
+                    await self.run_hook(self.approved)
+            elif self.action_id == "Rejected":
+                await self.open_view(self.get_reject_reason_view())
+                return
+            elif self.action_id == "Not allowed":
+                message = f"Same request/response user {self.user} not allowed. Prevent self approval is on."
+                await self.open_view(self.get_message_dialog_view("Warning", message))
+                return
+            elif self.action_id == "Reject Response":
+                with timer("provision.rejected", provision_class=self.name):
+                    await self.gather_calls(
+                        self.run_hook(self.rejected),
+                        *self.get_thread_coroutines(f"reason for rejection: {self.reason}", mention_requester),
+                    )
+            elif self.action_id == "Edit":
+                await self.open_view(self.get_edit_view())
+                return
+            elif self.action_id == "Modified":
+                await self.gather_calls(*self.get_modified_coroutines(thread_message=self.modifications_message,
+                                                                      mention_requester=mention_requester))
+                return
+        except Exception as e:
+            self.exception = e
+            logger.error(e, stack_info=True, exc_info=True)
+        with self.status_lock:
+            await self.gather_calls(*self.get_status_coroutines(status=self.action_id,
+                                                                mention_requester=mention_requester))
+            self.final_status_sent.set()
+
+    @staticmethod
+    async def approved():
+        logger.info("request approved")
+
+    @staticmethod
+    async def rejected():
+        logger.info("request rejected")
@@ -1,18 +1,50 @@
 import os
 import logging
 import json
-from slack_sdk import WebClient, errors
+from slack_sdk import errors
 
-from slack_approval.utils import get_buttons_blocks, get_header_block, get_inputs_blocks
+from slack_approval.cache import get_default_user_cache
+from slack_approval.clients import get_default_pool
+from slack_approval.digest import get_default_digest_buffer, get_summary, post_digest
+from slack_approval.metrics import instrumented, timer
+from slack_approval.rules import get_default_rules
+from slack_approval.state import dump_state, get_default_state_store
+from slack_approval.workspaces import route_request
+from slack_approval.utils import (
+    get_buttons_blocks,
+    get_exception_block,
+    get_header_block,
+    get_oversized_inputs,
+    get_status_block,
+    is_compact,
+    render_inputs,
+)
 
 logger = logging.getLogger("slack_request")
 logger.setLevel(logging.DEBUG)
 
 
 class SlackRequest:
-    def __init__(self, request):
+    def __init__(self, request, client_pool=None, user_cache=None, state_store=None):
         """requesters_channel only necessary for `pending` messages"""
-        self.inputs = request.json
+        self.load_inputs(request.json, client_pool, user_cache, state_store)
+
+        if "requester" in self.inputs and self.rule is None:
+            self.set_requester_info(self.client_pool.run(self.lookup_requester()))
+
+    def load_inputs(self, inputs, client_pool=None, user_cache=None, state_store=None):
+        self.workspace = route_request(inputs)
+        if self.workspace is not None:
+            self.client_pool = client_pool or self.workspace.client_pool
+            self.user_cache = user_cache or self.workspace.user_cache
+        else:
+            self.client_pool = client_pool or get_default_pool()
+            self.user_cache = user_cache or get_default_user_cache()
+        self.state_store = state_store or get_default_state_store()
+        self.digest_buffer = get_default_digest_buffer()
+        self.exception = None
+        self.approvers_ts = None
+        self.inputs = inputs
         self.name = self.inputs["provision_class"]
         self.value = self.inputs.copy()  # save inputs before hiding anything
         hide = self.inputs.get("hide")
@@ -20,13 +52,13 @@ class SlackRequest:
             for field in hide:
                 self.inputs.pop(field, None)
             self.inputs.pop("hide")
-        self.token = os.environ.get("SLACK_BOT_TOKEN")
-        self.approvers_channel = os.environ[
+        self.token = self.workspace.token if self.workspace is not None else os.environ.get("SLACK_BOT_TOKEN")
+        self.approvers_channel = self.get_channel(
             self.inputs.get("approvers_channel", "APPROVERS_CHANNEL")
-        ]
-        self.requesters_channel = os.environ[
+        )
+        self.requesters_channel = self.get_channel(
             self.inputs.get("requesters_channel", "REQUESTERS_CHANNEL")
-        ]
+        )
 
         if self.inputs.get("requesters_channel"):
             self.inputs.pop("requesters_channel")
@@ -34,57 +66,236 @@ class SlackRequest:
         if self.inputs.get("approvers_channel"):
             self.inputs.pop("approvers_channel")
 
-        if "requester" in self.inputs:
-            try:
-                slack_web_client = WebClient(self.token)
-                user_response = slack_web_client.users_lookupByEmail(email=self.inputs.get("requester"))
+        rules = get_default_rules()
+        self.rule = rules.match(self.name, self.value) if rules is not None else None
 
-                if user_response and user_response.status_code == 200:
-                    self.value["requester_info"] = json.dumps({"id":user_response["user"]["id"]})
-                    logger.info(self.value["requester_info"])
-            except errors.SlackApiError as e:
-                logger.error(e, stack_info=True, exc_info=True)
+    def get_channel(self, name):
+        """Channel id for a channel env var name, as mapped by the request's workspace if any"""
+        if self.workspace is not None:
+            return self.workspace.get_channel(name)
+        return os.environ[name]
 
+    def get_user_id(self, user_response):
+        if user_response and user_response.status_code == 200:
+            user_id = user_response["user"]["id"]
+            self.user_cache.set_user(user_id, self.inputs.get("requester"))
+            return user_id
 
+    def set_requester_info(self, user_id):
+        if user_id is not None:
+            self.value["requester_info"] = json.dumps({"id": user_id})
+            logger.info(self.value["requester_info"])
 
+    def set_requesters_ts(self, response):
+        # Save timestamp and requesters channel to be updated after provision
+        self.value["requesters_ts"] = response.get("ts")
+        self.value["requesters_channel"] = self.requesters_channel
+        self.value["approvers_channel"] = self.approvers_channel
 
-    def send_request_message(self):
-        slack_web_client = WebClient(self.token)
+    def get_request_blocks(self):
         blocks = []
         blocks.extend(get_header_block(self.name))
-        blocks.extend(get_inputs_blocks(self.inputs))
+        blocks.extend(render_inputs(self.name, self.inputs))
+        return blocks
+
+    @staticmethod
+    def get_requesters_blocks(blocks):
+        return blocks + [
+            {
+                "type": "section",
+                "text": {
+                    "type": "mrkdwn",
+                    "text": "*Request Pending*",
+                },
+            }
+        ]
+
+    def get_approvers_blocks(self, blocks):
+        value = dump_state(self.value, self.state_store)
+        edit_button = self.inputs.get("modifiables_fields", None) is not None and self.inputs.get("modifiables_fields") != ""
+        return blocks + get_buttons_blocks(value, edit_button=edit_button)
+
+    @instrumented("request.send", profile=True)
+    def send_request_message(self):
+        self.client_pool.run(self.send())
+
+    async def send(self):
+        """Posts to the requesters channel, then to the approvers channel, on the pooled keep-alive client"""
+        slack_web_client = self.client_pool.get_async_client(self.token)
+        if self.rule is not None:
+            await self.auto_approve(slack_web_client)
+            return
+        blocks = self.get_request_blocks()
 
         # First send to requesters channel
+        response = await self.post_requesters_message(slack_web_client, blocks)
+        if response is not None:
+            self.set_requesters_ts(response)
+        await self.post_approvers_message(slack_web_client, blocks)
+
+    async def lookup_requester(self, slack_web_client=None):
+        if "requester" not in self.inputs:
+            return None
+        user_id = self.user_cache.get_user_id(self.inputs.get("requester"))
+        if user_id is not None:
+            return user_id
         try:
-            response = slack_web_client.chat_postMessage(
+            slack_web_client = slack_web_client or self.client_pool.get_async_client(self.token)
+            user_response = await slack_web_client.users_lookupByEmail(email=self.inputs.get("requester"))
+            return self.get_user_id(user_response)
+        except errors.SlackApiError as e:
+            logger.error(e, stack_info=True, exc_info=True)
+
+    async def post_requesters_message(self, slack_web_client, blocks):
+        try:
+            return await slack_web_client.chat_postMessage(
                 channel=self.requesters_channel,
                 text="fallback",
-                blocks=blocks
-                + [
-                    {
-                        "type": "section",
-                        "text": {
-                            "type": "mrkdwn",
-                            "text": "*Request Pending*",
-                        },
-                    }
-                ],
+                blocks=self.get_requesters_blocks(blocks),
             )
-            # Save timestamp and requesters channel to be updated after provision
-            self.value["requesters_ts"] = response.get("ts")
-            self.value["requesters_channel"] = self.requesters_channel
-            self.value["approvers_channel"] = self.approvers_channel
         except errors.SlackApiError as e:
+            self.exception = e
             logger.error(e, stack_info=True, exc_info=True)
-        value = json.dumps(self.value)
 
-        edit_button = self.inputs.get("modifiables_fields", None) is not None and self.inputs.get("modifiables_fields") != ""
-        blocks.extend(get_buttons_blocks(value, edit_button = edit_button))
+    async def post_approvers_message(self, slack_web_client, blocks):
+        if self.digest_buffer.is_digest(self.name):
+            await self.add_to_digest(slack_web_client)
+            return
 
         # Send to approvers channel with `approve` and `reject` buttons
         try:
-            slack_web_client.chat_postMessage(
-                channel=self.approvers_channel, text="fallback", blocks=blocks
+            response = await slack_web_client.chat_postMessage(
+                channel=self.approvers_channel, text="fallback", blocks=self.get_approvers_blocks(blocks)
             )
+            self.approvers_ts = response.get("ts")
         except errors.SlackApiError as e:
+            self.exception = e
             logger.error(e, stack_info=True, exc_info=True)
+
+        snippet = self.get_snippet()
+        if snippet is not None:
+            try:
+                await slack_web_client.files_upload(**snippet)
+            except errors.SlackApiError as e:
+                logger.error(e, stack_info=True, exc_info=True)
+
+    def get_snippet(self):
+        """files.upload arguments for the full values a compact message shortened,
+        posted once in the approvers thread. None if nothing was shortened"""
+        if self.approvers_ts is None or not is_compact(self.name):
+            return None
+        oversized = get_oversized_inputs(self.inputs)
+        if not oversized:
+            return None
+        content = "\n\n".join(f"{key}:\n{value}" for key, value in oversized.items())
+        return {"channels": self.approvers_channel, "thread_ts": self.approvers_ts, "content": content,
+                "filetype": "text", "title": f"{self.name} full values"}
+
+    async def add_to_digest(self, slack_web_client=None):
+        """Buffers the request, the approvers message is posted with the digest it ends up in"""
+        slack_web_client = slack_web_client or self.client_pool.get_async_client(self.token)
+        team_id = self.workspace.team_id if self.workspace is not None else None
+        entries = self.digest_buffer.add(self.approvers_channel, self.name,
+                                         {"summary": get_summary(self.inputs), "value": self.value}, team_id=team_id)
+        if entries is None:
+            return
+        try:
+            self.approvers_ts = await post_digest(slack_web_client, self.approvers_channel, self.name, entries,
+                                                  self.digest_buffer, self.state_store, team_id)
+        except errors.SlackApiError as e:
+            # The entries are back in the buffer, the request is posted with the next digest
+            self.exception = e
+            logger.error(e, stack_info=True, exc_info=True)
+
+    async def auto_approve(self, slack_web_client=None):
+        """Runs the provision class's approved() without asking the approvers,
+        then posts one message with the outcome to the requesters channel"""
+        from slack_approval.registry import get_provision_class
+
+        slack_web_client = slack_web_client or self.client_pool.get_async_client(self.token)
+        user = f"auto-approval rule {self.rule}"
+        inputs = dict(self.value, requesters_channel=self.requesters_channel, approvers_channel=self.approvers_channel)
+        try:
+            provision = get_provision_class(self.name).from_inputs(inputs, user, self.client_pool, self.user_cache,
+                                                                   self.state_store, token=self.token)
+            with timer("provision.approved", provision_class=self.name, rule=self.rule):
+                await provision.run_hook(provision.approved)
+        except Exception as e:
+            self.exception = e
+            logger.error(e, stack_info=True, exc_info=True)
+
+        blocks = self.get_request_blocks() + get_status_block(status="Approved", user=user)
+        if self.exception:
+            blocks.extend(get_exception_block(self.exception))
+        try:
+            response = await slack_web_client.chat_postMessage(channel=self.requesters_channel, text="fallback",
+                                                               blocks=blocks)
+            self.value["requesters_ts"] = response.get("ts")
+        except errors.SlackApiError as e:
+            self.exception = e
+            logger.error(e, stack_info=True, exc_info=True)
+
+    def get_result(self):
+        return {
+            "requesters_ts": self.value.get("requesters_ts"),
+            "approvers_ts": self.approvers_ts,
+            "auto_approved": self.rule,
+            "error": str(self.exception) if self.exception else None,
+        }
+
+
+class AsyncSlackRequest(SlackRequest):
+    """Same messages as SlackRequest, but the requester lookup runs alongside
+    the requesters channel post. Only the approvers post waits on both."""
+
+    def __init__(self, request, client_pool=None, user_cache=None, state_store=None):
+        self.load_inputs(request.json, client_pool, user_cache, state_store)
+
+    @classmethod
+    def from_inputs(cls, inputs, client_pool=None, user_cache=None, state_store=None):
+        slack_request = cls.__new__(cls)
+        slack_request.load_inputs(inputs, client_pool, user_cache, state_store)
+        return slack_request
+
+    async def send(self):
+        import asyncio
+
+        slack_web_client = self.client_pool.get_async_client(self.token)
+        if self.rule is not None:
+            await self.auto_approve(slack_web_client)
+            return
+        blocks = self.get_request_blocks()
+
+        user_id, response = await asyncio.gather(
+            self.lookup_requester(slack_web_client),
+            self.post_requesters_message(slack_web_client, blocks),
+        )
+        # Same order as the sync path so the button value is identical
+        self.set_requester_info(user_id)
+        if response is not None:
+            self.set_requesters_ts(response)
+        await self.post_approvers_message(slack_web_client, blocks)
+
+
+def send_request_batch(requests, client_pool=None, user_cache=None, state_store=None, concurrency=10):
+    """Posts a list of requests with at most `concurrency` in flight.
+    Returns the message timestamps and error of every request, in order"""
+    async def send(inputs, semaphore):
+        async with semaphore:
+            try:
+                slack_request = AsyncSlackRequest.from_inputs(inputs, client_pool, user_cache, state_store)
+                await slack_request.send()
+                return slack_request.get_result()
+            except Exception as e:
+                logger.error(e, stack_info=True, exc_info=True)
+                return {"requesters_ts": None, "approvers_ts": None, "auto_approved": None, "error": str(e)}
+
+    async def send_all():
+        import asyncio
+
+        # Created inside the loop, python < 3.10 binds it to the current loop
+        semaphore = asyncio.Semaphore(concurrency)
+        return await asyncio.gather(*[send(inputs, semaphore) for inputs in requests])
+
+    # Requests of routed workspaces use their workspace's pool on this loop, see slack_approval.workspaces
+    return (client_pool or get_default_pool()).run(send_all())
@@ -0,0 +1,69 @@
+import json
+import os
+import threading
+import uuid
+
+# Pending requests can sit in the approvers channel for a while
+DEFAULT_TTL = 30 * 24 * 3600
+
+
+class RequestStateStore:
+    """Keeps request state server side so buttons and modals only carry its id.
+
+    The request and provision functions must share the backing store, ie. a
+    SQLiteStore or FileStore on a shared volume.
+    """
+
+    def __init__(self, store, ttl=DEFAULT_TTL):
+        self.store = store
+        self.ttl = ttl
+
+    def save(self, state):
+        request_id = uuid.uuid4().hex
+        # Copies in and out, so in-memory stores behave like the serializing ones
+        self.store.set(f"request:{request_id}", json.loads(json.dumps(state)), ttl=self.ttl)
+        return request_id
+
+    def load(self, request_id):
+        state = self.store.get(f"request:{request_id}")
+        if state is None:
+            raise KeyError(f"Request state {request_id} not found or expired")
+        return json.loads(json.dumps(state))
+
+
+def dump_state(state, state_store=None):
+    """Serializes state for a button value or private_metadata"""
+    if state_store is None:
+        return json.dumps(state)
+    return json.dumps({"request_id": state_store.save(state)})
+
+
+def load_state(value, state_store=None):
+    state = json.loads(value)
+    if isinstance(state, dict) and list(state) == ["request_id"]:
+        if state_store is None:
+            raise KeyError("Request state id received but no state store is configured")
+        return state_store.load(state["request_id"])
+    return state
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_state_store():
+    """None unless configured, set REQUEST_STATE_DB to a SQLite path to enable it"""
+    global _default_store
+    if _default_store is None and os.environ.get("REQUEST_STATE_DB"):
+        from slack_approval.stores import SQLiteStore
+
+        with _default_store_lock:
+            if _default_store is None:
+                _default_store = RequestStateStore(SQLiteStore(os.environ["REQUEST_STATE_DB"], table="request_state"))
+    return _default_store
+
+
+def set_default_state_store(state_store):
+    global _default_store
+    with _default_store_lock:
+        _default_store = state_store
@@ -0,0 +1,228 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryStore:
+    """In process LRU store with TTL eviction"""
+
+    def __init__(self, ttl=None, max_size=1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._set(key, value, ttl)
+
+    def add(self, key, value, ttl=None):
+        """Sets key only if it's absent or expired, returns whether it was set"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > time.time()):
+                return False
+            self._set(key, value, ttl)
+            return True
+
+    def update(self, key, function, ttl=None):
+        """Atomically replaces the value with function(value), see SQLiteStore.update"""
+        with self._lock:
+            entry = self._data.get(key)
+            value = entry[0] if entry is not None and (entry[1] is None or entry[1] > time.time()) else None
+            value, result = function(value)
+            if value is None:
+                self._data.pop(key, None)
+            else:
+                self._set(key, value, ttl)
+            return result
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def _set(self, key, value, ttl):
+        self._data[key] = (value, _expires(ttl if ttl is not None else self.ttl))
+        self._data.move_to_end(key)
+        while self.max_size and len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+
+class SQLiteStore:
+    """Local SQLite store, values are json encoded. Can be shared between
+    instances that mount the same file."""
+
+    def __init__(self, path, table="slack_approval", ttl=None, max_size=None):
+        import sqlite3
+
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} "
+            "(key TEXT PRIMARY KEY, value TEXT, expires REAL, updated REAL)"
+        )
+
+    def get(self, key):
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT value, expires FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] is not None and row[1] <= time.time():
+                self._connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                return None
+            return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        expires = _expires(ttl if ttl is not None else self.ttl)
+        with self._lock:
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires, updated) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires, time.time()),
+            )
+            self._evict()
+
+    def add(self, key, value, ttl=None):
+        """Sets key only if it's absent or expired, returns whether it was set.
+        Atomic across processes sharing the database file"""
+        expires = _expires(ttl if ttl is not None else self.ttl)
+        with self._lock:
+            self._connection.execute(
+                f"DELETE FROM {self.table} WHERE key = ? AND expires IS NOT NULL AND expires <= ?",
+                (key, time.time()),
+            )
+            cursor = self._connection.execute(
+                f"INSERT OR IGNORE INTO {self.table} (key, value, expires, updated) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires, time.time()),
+            )
+            return cursor.rowcount == 1
+
+    def update(self, key, function, ttl=None):
+        """Atomically replaces the value with function(value), which gets None if the key
+        is absent or expired and returns (new value, result). A None value deletes the key.
+        Returns result. Atomic across processes sharing the database file"""
+        expires = _expires(ttl if ttl is not None else self.ttl)
+        with self._lock:
+            # Takes the write lock before reading, so concurrent updates can't interleave
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._connection.execute(
+                    f"SELECT value, expires FROM {self.table} WHERE key = ?", (key,)
+                ).fetchone()
+                value = json.loads(row[0]) if row is not None and (row[1] is None or row[1] > time.time()) else None
+                value, result = function(value)
+                if value is None:
+                    self._connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                else:
+                    self._connection.execute(
+                        f"INSERT OR REPLACE INTO {self.table} (key, value, expires, updated) VALUES (?, ?, ?, ?)",
+                        (key, json.dumps(value), expires, time.time()),
+                    )
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+            return result
+
+    def delete(self, key):
+        with self._lock:
+            self._connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def _evict(self):
+        self._connection.execute(
+            f"DELETE FROM {self.table} WHERE expires IS NOT NULL AND expires <= ?", (time.time(),)
+        )
+        if self.max_size:
+            self._connection.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY updated DESC LIMIT -1 OFFSET ?)",
+                (self.max_size,),
+            )
+
+
+class FileStore:
+    """One json file per key in a local directory"""
+
+    def __init__(self, directory, ttl=None):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, key):
+        try:
+            with open(self._path(key)) as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if entry["expires"] is not None and entry["expires"] <= time.time():
+            self.delete(key)
+            return None
+        return entry["value"]
+
+    def set(self, key, value, ttl=None):
+        entry = {"value": value, "expires": _expires(ttl if ttl is not None else self.ttl)}
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self._path(key))
+
+    def add(self, key, value, ttl=None):
+        """Sets key only if it's absent or expired, returns whether it was set"""
+        if self.get(key) is not None:
+            return False
+        entry = {"value": value, "expires": _expires(ttl if ttl is not None else self.ttl)}
+        try:
+            fd = os.open(self._path(key), os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f)
+        return True
+
+    def update(self, key, function, ttl=None):
+        """Atomically replaces the value with function(value), see SQLiteStore.update.
+        Serialized with a lock file next to the key, POSIX only"""
+        import fcntl
+
+        with open(self._path(key) + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            value, result = function(self.get(key))
+            if value is None:
+                self.delete(key)
+            else:
+                self.set(key, value, ttl=ttl)
+            return result
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+
+def _expires(ttl):
+    return time.time() + ttl if ttl else None
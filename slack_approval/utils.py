@@ -1,3 +1,50 @@
+import os
+from functools import lru_cache
+
+from slack_approval.registry import get_class_key
+
+# Static parts of the blocks are built once and shared between renders, only the
+# variable parts are filled in per call. Rendered blocks are only serialized,
+# never mutated, so sharing them is safe.
+DIVIDER = {"type": "divider"}
+HIDDEN_INPUTS = frozenset(["provision_class", "modifiables_fields", "modified", "requester_info"])
+
+APPROVE_TEXT = {
+    "type": "plain_text",
+    "emoji": True,
+    "text": "Approve",
+}
+APPROVE_CONFIRM = {
+    "title": {
+        "type": "plain_text",
+        "text": "Confirm",
+    },
+    "text": {
+        "type": "mrkdwn",
+        "text": "Are you sure?",
+    },
+    "confirm": {"type": "plain_text", "text": "Do it"},
+    "deny": {
+        "type": "plain_text",
+        "text": "Stop, I've changed my mind!",
+    },
+}
+REJECT_TEXT = {
+    "type": "plain_text",
+    "emoji": True,
+    "text": "Reject",
+}
+EDIT_TEXT = {
+    "type": "plain_text",
+    "emoji": True,
+    "text": "Edit",
+}
+
+
+@lru_cache(maxsize=4096)
+def get_label(key):
+    return " ".join([s.capitalize() for s in key.split("_")])
+
 
 def get_header_block(name):
     return [{
@@ -8,7 +55,7 @@ def get_header_block(name):
             "emoji": True,
         },
     },
-    {"type": "divider"}]
+    DIVIDER]
 
 
 def get_inputs_blocks(inputs):
@@ -17,16 +64,93 @@ def get_inputs_blocks(inputs):
             "type": "section",
             "text": {
                 "type": "mrkdwn",
-                "text": f"*{' '.join([s.capitalize() for s in key.split('_')])}:* {value}",
+                "text": f"*{get_label(key)}:* {value}",
             },
         }
         for key, value in inputs.items()
-        if key != "provision_class" and key != "modifiables_fields" and key != "modified" and key != "requester_info"
+        if key not in HIDDEN_INPUTS
     ]
-    input_block.append({"type": "divider"})
+    input_block.append(DIVIDER)
     return input_block
 
 
+# section.fields limits, https://api.slack.com/reference/block-kit/blocks#section
+MAX_SECTION_FIELDS = 10
+MAX_FIELD_CHARS = 2000
+# Longer values are cut in compact messages, their full text goes in a snippet
+COMPACT_VALUE_CHARS = 200
+COMPACT_LIST_ITEMS = 10
+
+
+def get_compact_value(value, max_chars=COMPACT_VALUE_CHARS):
+    """Returns the value as shown in compact messages and whether it was shortened"""
+    shortened = False
+    if isinstance(value, list) and len(value) > COMPACT_LIST_ITEMS:
+        text = f"{', '.join(map(str, value[:COMPACT_LIST_ITEMS]))} … (+{len(value) - COMPACT_LIST_ITEMS} more)"
+        shortened = True
+    else:
+        text = f"{value}"
+    if len(text) > max_chars:
+        text = text[:max_chars - 1] + "…"
+        shortened = True
+    return text, shortened
+
+
+def get_compact_inputs_blocks(inputs):
+    """Packs the inputs into section fields, up to 10 per block, with long values shortened"""
+    fields = []
+    for key, value in inputs.items():
+        if key in HIDDEN_INPUTS:
+            continue
+        text, _ = get_compact_value(value)
+        fields.append({"type": "mrkdwn", "text": f"*{get_label(key)}:*\n{text}"[:MAX_FIELD_CHARS]})
+    blocks = [
+        {"type": "section", "fields": fields[start:start + MAX_SECTION_FIELDS]}
+        for start in range(0, len(fields), MAX_SECTION_FIELDS)
+    ]
+    blocks.append(DIVIDER)
+    return blocks
+
+
+def get_oversized_inputs(inputs):
+    """Inputs that compact messages shorten, {key: full text}"""
+    oversized = {}
+    for key, value in inputs.items():
+        if key not in HIDDEN_INPUTS and get_compact_value(value)[1]:
+            oversized[key] = "\n".join(map(str, value)) if isinstance(value, list) else f"{value}"
+    return oversized
+
+
+_renderers = {}
+
+
+def set_renderer(provision_class, renderer):
+    """Renders the inputs of `provision_class` with `renderer`, ie. get_compact_inputs_blocks"""
+    _renderers[get_class_key(provision_class)] = renderer
+
+
+@lru_cache(maxsize=16)
+def _compact_classes(value):
+    return frozenset(get_class_key(name.strip()) for name in value.split(",") if name.strip())
+
+
+def is_compact(provision_class):
+    """Set COMPACT_CLASSES to a comma separated list of provision classes, or *, to render them compact"""
+    key = get_class_key(provision_class)
+    if key in _renderers:
+        return _renderers[key] is get_compact_inputs_blocks
+    classes = _compact_classes(os.environ.get("COMPACT_CLASSES", ""))
+    return "*" in classes or key in classes
+
+
+def render_inputs(provision_class, inputs):
+    """Input blocks of a request, in the renderer selected for its provision class"""
+    renderer = _renderers.get(get_class_key(provision_class))
+    if renderer is None:
+        renderer = get_compact_inputs_blocks if is_compact(provision_class) else get_inputs_blocks
+    return renderer(inputs)
+
+
 def get_status_block(status, user, mention_requester=False, user_id=None):
     mention = f"<@{user_id}>" if mention_requester and user_id is not None else ""
     return [{
@@ -39,7 +163,7 @@ def get_status_block(status, user, mention_requester=False, user_id=None):
 
 def get_exception_block(exception):
     return [
-        {"type": "divider"},
+        DIVIDER,
         {
             "type": "section",
             "text": {
@@ -51,56 +175,30 @@ def get_exception_block(exception):
 
 def get_accepted_button(value):
     return {
-                        "type": "button",
-                        "text": {
-                            "type": "plain_text",
-                            "emoji": True,
-                            "text": "Approve",
-                        },
-                        "style": "primary",
-                        "action_id": "Approved",
-                        "value": value,
-                        "confirm": {
-                            "title": {
-                                "type": "plain_text",
-                                "text": "Confirm",
-                            },
-                            "text": {
-                                "type": "mrkdwn",
-                                "text": "Are you sure?",
-                            },
-                            "confirm": {"type": "plain_text", "text": "Do it"},
-                            "deny": {
-                                "type": "plain_text",
-                                "text": "Stop, I've changed my mind!",
-                            },
-                        },
-                    }
+        "type": "button",
+        "text": APPROVE_TEXT,
+        "style": "primary",
+        "action_id": "Approved",
+        "value": value,
+        "confirm": APPROVE_CONFIRM,
+    }
 
 def get_rejected_button(value):
     return {
-                        "type": "button",
-                        "text": {
-                            "type": "plain_text",
-                            "emoji": True,
-                            "text": "Reject",
-                        },
-                        "value": value,
-                        "style": "danger",
-                        "action_id": "Rejected",
-                    }
+        "type": "button",
+        "text": REJECT_TEXT,
+        "value": value,
+        "style": "danger",
+        "action_id": "Rejected",
+    }
 
 def get_edit_button(value):
     return {
-                        "type": "button",
-                        "text": {
-                            "type": "plain_text",
-                            "emoji": True,
-                            "text": "Edit",
-                        },
-                        "value": value,
-                        "action_id": "Edit",
-                    }
+        "type": "button",
+        "text": EDIT_TEXT,
+        "value": value,
+        "action_id": "Edit",
+    }
 def get_buttons_blocks(value, edit_button = False):
     buttons = [get_accepted_button(value), get_rejected_button(value)]
     if edit_button:
@@ -0,0 +1,136 @@
+"""Routes requests and interactions to the Slack workspace they belong to, so
+one deployment can serve several workspaces.
+
+SLACK_WORKSPACES points to a JSON file:
+
+    {"field": "workspace", "workspaces": [{
+        "team_id": "T0123", "name": "acme",
+        "token_env": "ACME_BOT_TOKEN", "signing_secret_env": "ACME_SIGNING_SECRET",
+        "channels": {"APPROVERS_CHANNEL": "C0123", "REQUESTERS_CHANNEL": "C0456"}
+    }]}
+
+Interactions are routed by the team id of their payload, requests by their
+`field` value, a team id or workspace name. Each workspace keeps its own
+client pool and user cache warm between invocations. Anything that isn't
+routed uses SLACK_BOT_TOKEN, SIGNING_SECRET and the channel env vars.
+"""
+import json
+import os
+import threading
+
+
+class Workspace:
+    def __init__(self, team_id, token, name=None, channels=None, signing_secret=None, pool_options=None):
+        self.team_id = team_id
+        self.name = name or team_id
+        self.token = token
+        self.channels = channels or {}
+        self.signing_secret = signing_secret
+        self.pool_options = pool_options or {}
+        self._client_pool = None
+        self._user_cache = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            team_id=config["team_id"],
+            token=config.get("token") or os.environ[config["token_env"]],
+            name=config.get("name"),
+            channels=config.get("channels"),
+            signing_secret=config.get("signing_secret") or os.environ.get(config.get("signing_secret_env", "")),
+            pool_options=config.get("pool"),
+        )
+
+    @property
+    def client_pool(self):
+        if self._client_pool is None:
+            from slack_approval.clients import SlackClientPool
+
+            with self._lock:
+                if self._client_pool is None:
+                    self._client_pool = SlackClientPool(**self.pool_options)
+        return self._client_pool
+
+    @property
+    def user_cache(self):
+        # User ids are per workspace, so are their lookups
+        if self._user_cache is None:
+            from slack_approval.cache import UserCache
+
+            with self._lock:
+                if self._user_cache is None:
+                    self._user_cache = UserCache()
+        return self._user_cache
+
+    def get_channel(self, name):
+        """Channel id for a channel env var name, the env var itself if the workspace doesn't map it"""
+        return self.channels.get(name) or os.environ[name]
+
+
+class WorkspaceRouter:
+    def __init__(self, workspaces=(), field="workspace"):
+        self.field = field
+        self._workspaces = {}
+        for workspace in workspaces:
+            self.add(workspace)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            config = json.load(f)
+        return cls([Workspace.from_config(workspace) for workspace in config["workspaces"]],
+                   field=config.get("field", "workspace"))
+
+    def add(self, workspace):
+        self._workspaces[workspace.team_id] = workspace
+        self._workspaces[workspace.name] = workspace
+
+    def for_team(self, team_id):
+        return self._workspaces.get(team_id) if team_id else None
+
+    def for_payload(self, payload):
+        """Workspace of an interaction payload, None if it isn't routed"""
+        return self.for_team((payload.get("team") or {}).get("id") or payload.get("team_id"))
+
+    def for_request(self, inputs):
+        """Workspace named by the request's routing field, None if it isn't routed"""
+        return self.for_team(inputs.get(self.field))
+
+    def signing_secrets(self):
+        return [workspace.signing_secret for workspace in self._workspaces.values() if workspace.signing_secret]
+
+    def close(self):
+        for workspace in set(self._workspaces.values()):
+            if workspace._client_pool is not None:
+                workspace._client_pool.close()
+
+
+_default_router = None
+_default_router_lock = threading.Lock()
+
+
+def get_default_router():
+    """Loaded once from the file at SLACK_WORKSPACES, None if it's not set"""
+    global _default_router
+    if _default_router is None and os.environ.get("SLACK_WORKSPACES"):
+        with _default_router_lock:
+            if _default_router is None:
+                _default_router = WorkspaceRouter.from_file(os.environ["SLACK_WORKSPACES"])
+    return _default_router
+
+
+def set_default_router(router):
+    global _default_router
+    with _default_router_lock:
+        _default_router = router
+
+
+def route_payload(payload):
+    router = get_default_router()
+    return router.for_payload(payload) if router is not None else None
+
+
+def route_request(inputs):
+    router = get_default_router()
+    return router.for_request(inputs) if router is not None else None
@@ -0,0 +1,72 @@
+import asyncio
+import random
+
+import pytest
+from slack_sdk import errors
+
+from slack_approval.digest import DigestBuffer, post_digest
+
+
+class Client:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.posted = []
+
+    async def chat_postMessage(self, channel, text, blocks):
+        if self.fail:
+            raise errors.SlackApiError("internal_error", {"ok": False, "error": "internal_error"})
+        self.posted.append(blocks)
+        return {"ts": f"1.{len(self.posted)}"}
+
+
+def entries(*summaries):
+    return [{"summary": summary, "value": {"provision_class": "Provision Service"}} for summary in summaries]
+
+
+@pytest.fixture
+def digest_buffer():
+    return DigestBuffer(classes={"Provision Service": {"window": 3600, "max_size": 2}})
+
+
+def test_failed_post_keeps_entries(digest_buffer):
+    digest_buffer.add("C1", "Provision Service", entries("a")[0])
+    taken = digest_buffer.add("C1", "Provision Service", entries("b")[0])
+    assert [entry["summary"] for entry in taken] == ["a", "b"]
+
+    with pytest.raises(errors.SlackApiError):
+        asyncio.run(post_digest(Client(fail=True), "C1", "Provision Service", taken, digest_buffer))
+    # Back in the buffer ahead of newer requests, and due right away
+    taken = digest_buffer.add("C1", "Provision Service", entries("c")[0])
+    assert [entry["summary"] for entry in taken] == ["a", "b"]
+    assert [entry["summary"] for _, _, due, _ in digest_buffer.take_due() for entry in due] == ["c"]
+
+
+def test_posted_digest_is_saved(digest_buffer):
+    client = Client()
+    ts = asyncio.run(post_digest(client, "C1", "Provision Service", entries("a", "b"), digest_buffer))
+    assert ts == "1.1"
+    assert len(digest_buffer.store.get(f"digest:message:C1:{ts}")["rows"]) == 2
+
+
+def test_last_row_update_shows_every_row(digest_buffer):
+    rows = 5
+    landed = []
+
+    async def send(blocks):
+        # Sends land in random order
+        await asyncio.sleep(random.random() * 0.01)
+        landed.append(blocks)
+
+    async def update(row):
+        digest = digest_buffer.set_row_status("C1", "1.0", row, f"done {row}")
+        await digest_buffer.send_digest("C1", "1.0", digest, send)
+
+    async def update_all():
+        await asyncio.gather(*[update(row) for row in range(rows)])
+
+    for _ in range(10):
+        landed.clear()
+        digest_buffer.save_digest("C1", "1.0", "Provision Service",
+                                  [{"summary": str(row), "value": "{}", "status": None} for row in range(rows)])
+        asyncio.run(update_all())
+        assert sum(1 for block in landed[-1] if block["type"] == "context") == rows
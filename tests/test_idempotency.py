@@ -0,0 +1,94 @@
+import json
+
+import pytest
+
+from slack_approval.cache import UserCache
+from slack_approval.deferred import StoredRequest
+from slack_approval.fake_slack import button_interaction
+from slack_approval.idempotency import IdempotencyGuard, get_idempotency_key
+from slack_approval.slack_provision import SlackProvision
+from slack_approval.utils import get_buttons_blocks
+
+APPROVER = {"id": "UAPPROVER", "name": "jane.approver"}
+
+
+def test_claim_complete_release():
+    guard = IdempotencyGuard()
+    assert guard.claim("key") is None
+    assert guard.claim("key")["status"] == "in progress"
+
+    guard.complete("key", {"action": "Approved", "exception": None})
+    assert guard.claim("key") == {"action": "Approved", "exception": None, "status": "done"}
+
+    guard.release("key")
+    assert guard.claim("key") is None
+
+
+def test_keys():
+    assert get_idempotency_key("1.0", "Approved", {"trigger_id": "t1"}) == "interaction:1.0:Approved"
+    # Opening a modal twice from the same message is fine, from the same trigger it's a retry
+    assert get_idempotency_key("1.0", "Rejected", {"trigger_id": "t1"}) == "interaction:1.0:Rejected:t1"
+    assert get_idempotency_key("1.0", "Rejected", {"trigger_id": "t2"}) == "interaction:1.0:Rejected:t2"
+
+
+@pytest.fixture
+def provision_request(monkeypatch):
+    monkeypatch.setenv("SLACK_BOT_TOKEN", "xoxb-test")
+    value = json.dumps({
+        "provision_class": "Provision Service",
+        "requester": "requester@example.com",
+        "prevent_self_approval": True,
+        "requesters_ts": "1.1",
+        "requesters_channel": "CREQUESTERS",
+        "approvers_channel": "CAPPROVERS",
+    })
+    message = {"blocks": get_buttons_blocks(value)}
+    payload = button_interaction(message, "Approved", APPROVER, "CAPPROVERS", "1.2")
+    return StoredRequest({"payload": json.dumps(payload)}, {})
+
+
+@pytest.fixture
+def user_cache():
+    user_cache = UserCache()
+    user_cache.set_user(APPROVER["id"], "jane.approver@example.com")
+    return user_cache
+
+
+def test_duplicate_delivery(provision_request, user_cache):
+    guard = IdempotencyGuard()
+    first = SlackProvision(provision_request, user_cache=user_cache, idempotency_guard=guard)
+    retry = SlackProvision(provision_request, user_cache=user_cache, idempotency_guard=guard)
+    assert first.action_id == "Approved"
+    assert retry.action_id == "Duplicate"
+
+    # Releasing a duplicate can't drop the claim of the delivery handling it
+    retry.release_interaction()
+    assert guard.claim(first.idempotency_key) is not None
+
+
+def test_failure_before_handling_releases_claim(provision_request, user_cache):
+    class FailingProvision(SlackProvision):
+        def is_allowed(self):
+            raise RuntimeError("users.info failed")
+
+    guard = IdempotencyGuard()
+    with pytest.raises(RuntimeError):
+        FailingProvision(provision_request, user_cache=user_cache, idempotency_guard=guard)
+    # Slack's retry gets handled
+    retry = SlackProvision(provision_request, user_cache=user_cache, idempotency_guard=guard)
+    assert retry.action_id == "Approved"
+
+    # ie. the provision function failing to resolve the class
+    retry.release_interaction()
+    assert SlackProvision(provision_request, user_cache=user_cache, idempotency_guard=guard).action_id == "Approved"
+
+
+def test_not_allowed_releases_claim(provision_request):
+    user_cache = UserCache()
+    user_cache.set_user(APPROVER["id"], "requester@example.com")
+    guard = IdempotencyGuard()
+    provision = SlackProvision(provision_request, user_cache=user_cache, idempotency_guard=guard)
+    assert provision.action_id == "Not allowed"
+    assert provision.idempotency_key is None
+    # Left to an approver that is allowed
+    assert guard.claim("interaction:1.2:Approved") is None
@@ -0,0 +1,134 @@
+import copy
+import re
+
+import pytest
+
+from slack_approval.modifications import MAX_MODAL_BLOCKS, get_modifiable_fields_blocks, get_modifications
+
+
+def baseline_get_modifications(state_values, inputs):
+    """SlackProvision.get_modifications before the single pass rewrite, returns the modifications message"""
+    message = None
+    blocks = {
+        block_name.replace("block_id_", ""): block_values
+        for block_name, block_values in state_values.items()
+        if "block_id_" in block_name and not "multivalue_block_id_" in block_name
+    }
+    blocks = {
+        block_name: block_values
+        for block_name, block_values in blocks.items()
+        if f"action_id_{block_name}" in block_values
+    }
+    for block_name, block_values in blocks.items():
+        actual_value = inputs[block_name]
+        new_value = block_values[f"action_id_{block_name}"]["value"]
+        if actual_value != new_value:
+            if message is None:
+                message = "Modifications: "
+            inputs[block_name] = new_value
+            message = f"{message} {actual_value} -> {new_value} \n"
+
+    blocks = {
+        block_name.replace("multivalue_block_id_", ""): block_values
+        for block_name, block_values in state_values.items()
+        if "multivalue_block_id_" in block_name
+    }
+    old_values = {}
+    for block_name, block_values in blocks.items():
+        key = re.sub(r"_\d+$", '', block_name)
+        if key not in old_values:
+            old_values[key] = inputs[key].copy()
+            inputs[key] = []
+    blocks = {
+        block_name: block_values
+        for block_name, block_values in blocks.items()
+        if f"action_id_{block_name}" in block_values
+    }
+    for block_name, block_values in blocks.items():
+        new_value = block_values[f"action_id_{block_name}"]["value"]
+        if new_value is None or new_value == "":
+            continue
+        inputs[re.sub(r"_\d+$", '', block_name)].append(new_value)
+
+    for block_name, block_values in old_values.items():
+        new_value = inputs[block_name]
+        if new_value != block_values:
+            if message is None:
+                message = "Modifications: "
+            message = f"{message} {block_name}:{block_values} -> {new_value} \n"
+    return message
+
+
+def submit(fields, edit=None):
+    """State values Slack sends for the edit modal of `fields`, with `edit(block_id, value)` applied"""
+    values = {}
+    for block in get_modifiable_fields_blocks(fields):
+        if block["type"] != "input":
+            continue
+        value = block["element"]["initial_value"]
+        if edit is not None:
+            value = edit(block["block_id"], value)
+        values[block["block_id"]] = {block["element"]["action_id"]: {"type": "plain_text_input", "value": value}}
+    return values
+
+
+def compare(inputs, state_values, baseline_state_values=None):
+    baseline_inputs, new_inputs = copy.deepcopy(inputs), copy.deepcopy(inputs)
+    baseline_message = baseline_get_modifications(baseline_state_values or state_values, baseline_inputs)
+    changes, message = get_modifications(state_values, new_inputs)
+    assert new_inputs == baseline_inputs
+    assert message == baseline_message
+    return changes
+
+
+def test_single_fields():
+    inputs = {"provision_class": "Provision Service", "name": "web", "size": "small"}
+    fields = {"name": "web", "size": "small"}
+
+    assert compare(inputs, submit(fields)) == {}
+    changes = compare(inputs, submit(fields, lambda block_id, value: "large" if block_id.endswith("size") else value))
+    assert changes == {"size": {"old": "small", "new": "large", "added": [], "removed": []}}
+
+
+@pytest.mark.parametrize("edit", [
+    None,
+    lambda block_id, value: "" if block_id.endswith("_1") else value,
+    lambda block_id, value: value + "0" if block_id.endswith("_0") else value,
+])
+def test_multivalue_fields(edit):
+    inputs = {"provision_class": "Provision Service", "name": "web", "ips": ["10.0.0.1", "10.0.0.2", "10.0.0.3"]}
+    fields = {"name": "web", "ips": list(inputs["ips"])}
+    compare(inputs, submit(fields, edit))
+
+
+def test_removed_list_item_changes():
+    inputs = {"provision_class": "Provision Service", "ips": ["10.0.0.1", "10.0.0.2"]}
+    changes = compare(inputs, submit({"ips": list(inputs["ips"])},
+                                     lambda block_id, value: "" if block_id.endswith("_0") else value))
+    assert changes["ips"]["removed"] == ["10.0.0.1"]
+    assert changes["ips"]["added"] == []
+
+
+def test_chunked_fields_match_multivalue():
+    ips = [f"10.0.{i // 256}.{i % 256}" for i in range(MAX_MODAL_BLOCKS + 50)]
+    inputs = {"provision_class": "Provision Service", "ips": ips}
+    state_values = submit({"ips": list(ips)})
+    assert len(state_values) > 1
+    assert all(block_id.startswith("multiline_block_id_") for block_id in state_values)
+
+    def multivalue(items):
+        # The baseline only knew one input per item, it sees the same items as multivalue blocks
+        return {
+            f"multivalue_block_id_ips_{number}": {f"action_id_ips_{number}": {"value": item}}
+            for number, item in enumerate(items)
+        }
+
+    assert compare(inputs, state_values, multivalue(ips)) == {}
+
+    last_block = list(state_values)[-1]
+
+    def drop_last(block_id, value):
+        return "\n".join(value.splitlines()[:-1]) if block_id == last_block else value
+
+    changes = compare(inputs, submit({"ips": list(ips)}, drop_last), multivalue(ips[:-1]))
+    assert changes["ips"]["removed"] == [ips[-1]]
@@ -0,0 +1,61 @@
+import json
+import time
+
+import pytest
+
+from slack_approval.fake_slack import signed_interaction
+from slack_approval.signature import is_signed_for, is_signed_request
+from slack_approval.workspaces import Workspace, WorkspaceRouter, set_default_router
+
+
+@pytest.fixture
+def router(monkeypatch):
+    monkeypatch.setenv("SIGNING_SECRET", "default-secret")
+    router = WorkspaceRouter([
+        Workspace("TA", "xoxb-a", name="a", signing_secret="secret-a"),
+        Workspace("TB", "xoxb-b", name="b", signing_secret="secret-b"),
+    ])
+    set_default_router(router)
+    yield router
+    set_default_router(None)
+
+
+def payload(team_id=None):
+    payload = {"type": "block_actions", "actions": [{"action_id": "Approved", "value": "{}"}]}
+    if team_id is not None:
+        payload["team"] = {"id": team_id}
+    return payload
+
+
+def check(request, secrets):
+    """The provision function's checks, on the raw body then on the parsed payload"""
+    signing_secret = is_signed_request(request.headers, request.get_data(), secrets)
+    return signing_secret is not None and is_signed_for(json.loads(request.form["payload"]), signing_secret)
+
+
+def test_returns_matching_secret():
+    request = signed_interaction(payload(), "secret-b")
+    assert is_signed_request(request.headers, request.get_data(), ["secret-a", "secret-b"]) == "secret-b"
+    assert is_signed_request(request.headers, request.get_data(), ["secret-a"]) is None
+
+
+def test_rejects_stale_request():
+    request = signed_interaction(payload(), "secret-a", timestamp=int(time.time()) - 600)
+    assert is_signed_request(request.headers, request.get_data(), ["secret-a"]) is None
+
+
+def test_accepts_own_workspace_secret(router):
+    secrets = ["default-secret"] + router.signing_secrets()
+    assert check(signed_interaction(payload("TA"), "secret-a"), secrets)
+    assert check(signed_interaction(payload("TB"), "secret-b"), secrets)
+    assert check(signed_interaction(payload(), "default-secret"), secrets)
+
+
+def test_rejects_other_workspace_secret(router):
+    secrets = ["default-secret"] + router.signing_secrets()
+    # Signed with workspace A's secret, but routed to workspace B and its token
+    assert not check(signed_interaction(payload("TB"), "secret-a"), secrets)
+    assert not check(signed_interaction(payload("TA"), "default-secret"), secrets)
+    # Unrouted payloads only accept SIGNING_SECRET
+    assert not check(signed_interaction(payload(), "secret-a"), secrets)
+    assert not check(signed_interaction(payload("TUNKNOWN"), "secret-b"), secrets)
@@ -0,0 +1,105 @@
+import threading
+import time
+
+import pytest
+
+from slack_approval.digest import DigestBuffer
+from slack_approval.stores import SQLiteStore
+
+THREADS = 4
+ROUNDS = 50
+
+
+@pytest.fixture
+def stores(tmp_path):
+    """Two connections to one database, like two instances sharing DIGEST_DB"""
+    path = str(tmp_path / "shared.db")
+    return SQLiteStore(path, table="shared"), SQLiteStore(path, table="shared")
+
+
+def run_concurrently(*targets):
+    barrier = threading.Barrier(len(targets))
+    failures = []
+
+    def run(target):
+        barrier.wait()
+        try:
+            target()
+        except Exception as e:
+            failures.append(e)
+
+    threads = [threading.Thread(target=run, args=(target,)) for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if failures:
+        raise failures[0]
+
+
+def test_add_claims_each_key_once(stores):
+    added = []
+
+    def claim(store):
+        def run():
+            for number in range(ROUNDS):
+                if store.add(f"key:{number}", {"by": id(store)}):
+                    added.append(number)
+        return run
+
+    run_concurrently(*[claim(stores[number % 2]) for number in range(THREADS)])
+    assert sorted(added) == list(range(ROUNDS))
+
+
+def test_update_loses_no_writes(stores):
+    def increment(value):
+        # Between the read and the write, where a non atomic update would lose the other connection's write
+        time.sleep(0.001)
+        value = (value or 0) + 1
+        return value, value
+
+    def run(store):
+        return lambda: [store.update("counter", increment) for _ in range(ROUNDS)]
+
+    run_concurrently(*[run(stores[number % 2]) for number in range(THREADS)])
+    assert stores[0].get("counter") == THREADS * ROUNDS
+
+
+def test_update_deletes_on_none(stores):
+    stores[0].set("key", 1)
+    assert stores[1].update("key", lambda value: (None, value)) == 1
+    assert stores[0].get("key") is None
+
+
+def test_digest_buffers_keep_every_request(stores):
+    buffers = [DigestBuffer(store, {"Provision Service": {"window": 3600, "max_size": 7}}) for store in stores]
+    taken = []
+
+    def add(buffer, worker):
+        def run():
+            for number in range(ROUNDS):
+                entries = buffer.add("C1", "Provision Service", {"summary": f"{worker}-{number}", "value": {}})
+                if entries is not None:
+                    taken.extend(entries)
+        return run
+
+    run_concurrently(*[add(buffers[worker % 2], worker) for worker in range(THREADS)])
+    for _, _, entries, _ in buffers[0].take_due(now=1e12):
+        taken.extend(entries)
+    summaries = sorted(entry["summary"] for entry in taken)
+    assert summaries == sorted(f"{worker}-{number}" for worker in range(THREADS) for number in range(ROUNDS))
+
+
+def test_digest_row_statuses_are_kept(stores):
+    buffers = [DigestBuffer(store) for store in stores]
+    rows = 20
+    buffers[0].save_digest("C1", "1.0", "Provision Service",
+                           [{"summary": str(row), "value": "{}", "status": None} for row in range(rows)])
+
+    def click(buffer, worker):
+        return lambda: [buffer.set_row_status("C1", "1.0", row, "done") for row in range(worker, rows, THREADS)]
+
+    run_concurrently(*[click(buffers[worker % 2], worker) for worker in range(THREADS)])
+    digest = buffers[1].store.get("digest:message:C1:1.0")
+    assert [row["status"] for row in digest["rows"]] == ["done"] * rows
+    assert digest["version"] == rows